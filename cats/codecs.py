@@ -1,13 +1,11 @@
 from dataclasses import dataclass
-from io import BytesIO
-from os.path import getsize
-from pathlib import Path
+from pathlib import Path, PosixPath, WindowsPath
 from typing import Any, Dict, IO, List, Optional, Type, Union
 
-import ujson
+import orjson
 
 from cats.headers import T_Headers
-from cats.utils import tmp_file
+from cats.utils import buffer_pool, copy_file_part, tmp_file
 
 __all__ = [
     'NULL',
@@ -84,7 +82,11 @@ class ByteCodec(BaseCodec):
         if data is not None and not isinstance(data, (bytes, bytearray, memoryview)):
             raise TypeError(f'{cls.__name__} does not support {type(data).__name__}')
 
-        return (bytes(data) if data else bytes())[offset:]
+        if not data:
+            return bytes()
+        if offset:
+            return bytes(memoryview(data)[offset:])
+        return bytes(data)
 
     @classmethod
     async def decode(cls, data: bytes, headers: T_Headers) -> bytes:
@@ -95,13 +97,18 @@ class JsonCodec(BaseCodec):
     type_id = 0x01
     type_name = 'json'
     encoding = 'utf-8'
+    # Escape "</" as "<\/", required only when payload is embedded into HTML <script> tags
+    escape_html_forward_slash: bool = False
 
     @classmethod
     async def encode(cls, data: Json, headers: T_Headers, offset: int = 0) -> bytes:
         if not isinstance(data, (str, int, float, dict, list, bool, type(None))):
             raise TypeError(f'{cls.__name__} does not support {type(data).__name__}')
 
-        return ujson.encode(data, ensure_ascii=False).replace("</", "<\\/").encode(cls.encoding)[offset:]
+        encoded = orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+        if cls.escape_html_forward_slash:
+            encoded = encoded.replace(b'</', b'<\\/')
+        return encoded[offset:] if offset else encoded
 
     @classmethod
     async def decode(cls, data: bytes, headers) -> Json:
@@ -109,10 +116,7 @@ class JsonCodec(BaseCodec):
             return {}
 
         try:
-            data = data.decode(cls.encoding)
-            if not data:
-                return {}
-            return ujson.decode(data)
+            return orjson.loads(data)
         except ValueError:
             raise ValueError('Failed to parse JSON from data')
 
@@ -131,35 +135,38 @@ class FileCodec(BaseCodec):
     @classmethod
     def path_to_file_info(cls, path: Path) -> FileInfo:
         if not isinstance(path, Path):
-            raise TypeError
-        return FileInfo(path.name, path, getsize(path.as_posix()), None)
+            raise TypeError(f'Expected Path, got {type(path).__name__}')
+        return FileInfo(path.name, path, path.stat().st_size, None)
 
     @classmethod
     def normalize_input(cls, data: FILE_TYPES) -> Dict[str, FileInfo]:
         if isinstance(data, Path):
             data = cls.path_to_file_info(data)
+            return {data.name: data}
+        elif isinstance(data, FileInfo):
+            return {data.name: data}
         elif isinstance(data, list):
-            res = []
+            result = {}
             for i in data:
-                if not isinstance(i, (FileInfo, Path)):
+                if isinstance(i, Path):
+                    i = cls.path_to_file_info(i)
+                elif not isinstance(i, FileInfo):
                     raise TypeError
-                res.append(i if isinstance(i, FileInfo) else cls.path_to_file_info(i))
-
+                result[i.name] = i
+            return result
         elif isinstance(data, dict):
-            res = {}
+            result = {}
             for k, v in data.items():
-                if not isinstance(k, str) or not isinstance(v, (FileInfo, Path)):
+                if not isinstance(k, str):
+                    raise TypeError
+                if isinstance(v, Path):
+                    v = cls.path_to_file_info(v)
+                elif not isinstance(v, FileInfo):
                     raise TypeError
-                res[k] = v if isinstance(v, FileInfo) else cls.path_to_file_info(v)
-        elif not isinstance(data, FileInfo):
-            raise TypeError
+                result[k] = v
+            return result
 
-        if isinstance(data, FileInfo):
-            return {data.name: data}
-        elif isinstance(data, list):
-            return {i.name: i for i in data}
-        else:
-            return data
+        raise TypeError
 
     @classmethod
     async def encode(cls, data: FILE_TYPES, headers: T_Headers, offset: int = 0) -> Path:
@@ -175,13 +182,7 @@ class FileCodec(BaseCodec):
                         continue
                     header.append({"key": key, "name": info.name, "size": left, "type": info.mime})
                     with info.path.open('rb') as f_fh:
-                        f_fh.seek(info.size - left)
-                        while left > 0:
-                            buff = f_fh.read(1 << 24)
-                            if not len(buff):
-                                raise ValueError
-                            fh.write(buff)
-                            left -= len(buff)
+                        copy_file_part(f_fh, fh, info.size - left, left)
             headers['Files'] = header
             return tmp
 
@@ -192,28 +193,21 @@ class FileCodec(BaseCodec):
     @classmethod
     async def decode(cls, data: Union[Path, bytes, bytearray], headers) -> Files:
         result = Files()
-        buff = data.open('rb') if isinstance(data, Path) else BytesIO(data)
+        buff = data.open('rb') if isinstance(data, Path) else memoryview(data)
+        pos = 0
 
         try:
-            if 'Files' not in headers:
-                raise ValueError('Failed to parse Files meta data from headers')
-
-            header = headers['Files']
-
-            if not isinstance(header, list):
-                raise ValueError
-
-            for node in header:
-                if not isinstance(node, dict):
+            for node in headers['Files']:
+                key, name, size, mime = node['key'], node['name'], node['size'], node.get('type')
+                if not isinstance(size, int) or size < 0:
                     raise ValueError
 
-                tmp = await cls._unpack_file(buff, node)
-                result[node['key']] = FileInfo(
-                    name=node['name'],
-                    path=tmp,
-                    size=node['size'],
-                    mime=node.get('type'),
-                )
+                if isinstance(buff, memoryview):
+                    tmp = await cls._unpack_view(buff[pos:pos + size], size)
+                    pos += size
+                else:
+                    tmp = await cls._unpack_file(buff, size)
+                result[key] = FileInfo(name=name, path=tmp, size=size, mime=mime)
 
             return result
         except (KeyError, ValueError, TypeError):
@@ -221,19 +215,35 @@ class FileCodec(BaseCodec):
                 v.path.unlink(missing_ok=True)
             raise ValueError('Failed to parse Files form data')
         finally:
-            buff.close()
+            if isinstance(buff, memoryview):
+                buff.release()
+            else:
+                buff.close()
 
     @classmethod
-    async def _unpack_file(cls, fh: IO, node) -> Path:
+    async def _unpack_file(cls, fh: IO, size: int) -> Path:
+        tmp = tmp_file()
+        left = size
+        try:
+            with tmp.open('wb') as node_fh, buffer_pool.buffer() as buff, memoryview(buff) as view:
+                while left > 0:
+                    n = fh.readinto(view[:min(left, len(view))])
+                    if not n:
+                        raise ValueError
+                    node_fh.write(view[:n])
+                    left -= n
+        except Exception:
+            tmp.unlink(missing_ok=True)
+            raise
+        return tmp
+
+    @classmethod
+    async def _unpack_view(cls, view: memoryview, size: int) -> Path:
+        if len(view) != size:
+            raise ValueError
         tmp = tmp_file()
-        left = node['size']
         with tmp.open('wb') as node_fh:
-            while left > 0:
-                buff = fh.read(min(left, 1 << 24))
-                if not len(buff):
-                    raise ValueError
-                node_fh.write(buff)
-                left -= len(buff)
+            node_fh.write(view)
         return tmp
 
 
@@ -248,11 +258,57 @@ class Codec:
         T_FILE: FileCodec,
     }
 
+    # Exact payload type -> type_id, resolved with one dict lookup before falling back to isinstance checks
+    type_map = {
+        type(None): T_BYTE,
+        bytes: T_BYTE,
+        bytearray: T_BYTE,
+        memoryview: T_BYTE,
+        str: T_JSON,
+        int: T_JSON,
+        float: T_JSON,
+        bool: T_JSON,
+        PosixPath: T_FILE,
+        WindowsPath: T_FILE,
+        FileInfo: T_FILE,
+    }
+
+    @classmethod
+    def get_type_id(cls, buff: Any) -> Optional[int]:
+        """
+        Picks codec type_id by payload type, so only one codec has to try encoding it.
+        Returns None for types unknown to builtin codecs
+        """
+        type_id = cls.type_map.get(type(buff))
+        if type_id is not None:
+            return type_id
+
+        if buff is None or isinstance(buff, (bytes, bytearray, memoryview)):
+            return cls.T_BYTE
+        elif isinstance(buff, (str, int, float)):
+            return cls.T_JSON
+        elif isinstance(buff, (Path, FileInfo)):
+            return cls.T_FILE
+        elif isinstance(buff, (list, dict)):
+            values = buff.values() if isinstance(buff, dict) else buff
+            if values and isinstance(next(iter(values)), (Path, FileInfo)):
+                return cls.T_FILE
+            return cls.T_JSON
+        return None
+
     @classmethod
     async def encode(cls, buff: Union[Byte, Json, FILE_TYPES], headers: T_Headers, offset: int = 0) -> (bytes, int):
         """
         Takes any supported data type and returns tuple (encoded: bytes, type_id: int)
         """
+        type_id = cls.get_type_id(buff)
+        if type_id is not None:
+            try:
+                encoded = await cls.codecs[type_id].encode(buff, headers, offset)
+                return encoded, type_id
+            except TypeError:
+                raise TypeError(f'Failed to encode data: Type {type(buff).__name__} not supported')
+
         for type_id, codec in cls.codecs.items():
             try:
                 encoded = await codec.encode(buff, headers, offset)
@@ -1,37 +1,209 @@
 import gzip
 import os
 import shutil
+import zlib
+from asyncio import get_running_loop
 from pathlib import Path
-from typing import Union
+from typing import Iterator, Union
+
+try:
+    # libdeflate bindings, ~2x faster than zlib on whole in-memory buffers
+    import deflate
+except ImportError:
+    deflate = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
 
 __all__ = [
     'Compressor',
 ]
 
+# Buffers larger than that are (de)compressed in the loop's default executor instead of blocking the event loop.
+# zlib releases the GIL, so this runs in parallel with the loop
+EXECUTOR_THRESHOLD = 1 << 16
+
 
 class BaseCompressor:
+    """
+    Subclasses implement blocking _compress/_decompress/_compress_file/_decompress_file,
+    large buffers and files are handed to the loop's default executor
+    """
     type_id: int
 
     @classmethod
     async def compress(cls, data: bytes) -> bytes:
-        raise NotImplementedError
+        if len(data) > EXECUTOR_THRESHOLD:
+            return await get_running_loop().run_in_executor(None, cls._compress, data)
+        return cls._compress(data)
 
     @classmethod
     async def decompress(cls, data: bytes) -> bytes:
-        raise NotImplementedError
+        if len(data) > EXECUTOR_THRESHOLD:
+            return await get_running_loop().run_in_executor(None, cls._decompress, data)
+        return cls._decompress(data)
 
     @classmethod
     async def compress_file(cls, src: Path, dst: Path) -> None:
-        raise NotImplementedError
+        await get_running_loop().run_in_executor(None, cls._compress_file, src, dst)
 
     @classmethod
     async def decompress_file(cls, src: Path, dst: Path) -> None:
+        await get_running_loop().run_in_executor(None, cls._decompress_file, src, dst)
+
+    @classmethod
+    def decompressor(cls):
+        """
+        Returns incremental decompressor with decompress(data) -> Iterator[bytes] and flush() -> bytes methods,
+        which lets payload be decompressed while it is being received. None if compressor doesn't support it
+        """
+        return None
+
+    @staticmethod
+    def _compress(data: bytes) -> bytes:
         raise NotImplementedError
 
+    @staticmethod
+    def _decompress(data: bytes) -> bytes:
+        raise NotImplementedError
+
+    @staticmethod
+    def _compress_file(src: Path, dst: Path) -> None:
+        raise NotImplementedError
+
+    @staticmethod
+    def _decompress_file(src: Path, dst: Path) -> None:
+        raise NotImplementedError
+
+
+class DummyDecompressor:
+    __slots__ = ()
+
+    def decompress(self, data: bytes) -> Iterator[bytes]:
+        if data:
+            yield data
+
+    def flush(self) -> bytes:
+        return b''
+
+
+class GzipDecompressor:
+    __slots__ = ('_obj',)
+    # Upper bound of a single output piece, a few KB of input can inflate to gigabytes
+    MAX_OUTPUT = 1 << 24
+
+    def __init__(self):
+        self._obj = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def decompress(self, data: bytes) -> Iterator[bytes]:
+        """Yields decompressed data in pieces of at most MAX_OUTPUT bytes"""
+        try:
+            while data:
+                piece = self._obj.decompress(data, self.MAX_OUTPUT)
+                if self._obj.unconsumed_tail:
+                    data = self._obj.unconsumed_tail
+                elif self._obj.eof and self._obj.unused_data:
+                    # Input may consist of several concatenated gzip members, same as gzip.open() reads them
+                    data = self._obj.unused_data
+                    self._obj = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                else:
+                    data = None
+                if piece:
+                    yield piece
+        except zlib.error as err:
+            raise ValueError(str(err))
+
+    def flush(self) -> bytes:
+        try:
+            result = self._obj.flush()
+        except zlib.error as err:
+            raise ValueError(str(err))
+        if not self._obj.eof:
+            raise ValueError('Compressed data ended before the end-of-stream marker was reached')
+        return result
+
+
+class ZstdDecompressor:
+    __slots__ = ('_obj',)
+    # Upper bound of a single output piece, same as GzipDecompressor.MAX_OUTPUT
+    MAX_OUTPUT = 1 << 24
+    # zstd decompressobj() can't limit its output, but one input byte inflates to at most 32 KiB
+    # (4-byte RLE block of 128 KiB), so input is fed in slices that can't produce more than about MAX_OUTPUT
+    MAX_INPUT = MAX_OUTPUT >> 15
+
+    def __init__(self):
+        self._obj = zstandard.ZstdDecompressor().decompressobj()
+
+    def decompress(self, data: bytes) -> Iterator[bytes]:
+        """Yields decompressed data in pieces of about MAX_OUTPUT bytes at most"""
+        try:
+            with memoryview(data) as view:
+                for pos in range(0, len(view), self.MAX_INPUT):
+                    piece = view[pos:pos + self.MAX_INPUT]
+                    while piece:
+                        if self._obj.eof:
+                            # Input may consist of several concatenated frames
+                            self._obj = zstandard.ZstdDecompressor().decompressobj()
+                        result = self._obj.decompress(piece)
+                        piece = self._obj.unused_data if self._obj.eof else None
+                        if result:
+                            yield result
+        except zstandard.ZstdError as err:
+            raise ValueError(str(err))
+
+    def flush(self) -> bytes:
+        if not self._obj.eof:
+            raise ValueError('Compressed data ended before the end-of-stream marker was reached')
+        return b''
+
+
+class LZ4Decompressor:
+    __slots__ = ('_obj',)
+    # Upper bound of a single output piece, same as GzipDecompressor.MAX_OUTPUT
+    MAX_OUTPUT = 1 << 24
+
+    def __init__(self):
+        self._obj = lz4.frame.LZ4FrameDecompressor()
+
+    def decompress(self, data: bytes) -> Iterator[bytes]:
+        """Yields decompressed data in pieces of at most MAX_OUTPUT bytes"""
+        try:
+            while True:
+                piece = self._obj.decompress(data, self.MAX_OUTPUT)
+                if piece:
+                    yield piece
+                if self._obj.eof and self._obj.unused_data:
+                    # Input may consist of several concatenated frames
+                    data = self._obj.unused_data
+                    self._obj = lz4.frame.LZ4FrameDecompressor()
+                elif not self._obj.eof and not self._obj.needs_input:
+                    # Output limit was reached, rest of the input is kept by decompressor
+                    data = b''
+                else:
+                    break
+        except RuntimeError as err:
+            raise ValueError(str(err))
+
+    def flush(self) -> bytes:
+        if not self._obj.eof:
+            raise ValueError('Compressed data ended before the end-of-stream marker was reached')
+        return b''
+
 
 class DummyCompressor(BaseCompressor):
     type_id = 0x00
 
+    @classmethod
+    def decompressor(cls):
+        return DummyDecompressor()
+
     @classmethod
     async def compress(cls, data: bytes) -> bytes:
         return data
@@ -53,35 +225,128 @@ class GzipCompressor(BaseCompressor):
     type_id = 0x01
 
     @classmethod
-    async def compress(cls, data: bytes) -> bytes:
+    def decompressor(cls):
+        return GzipDecompressor()
+
+    @staticmethod
+    def _compress(data: bytes) -> bytes:
+        if deflate is not None:
+            return deflate.gzip_compress(data, 9)
         return gzip.compress(data, compresslevel=9)
 
-    @classmethod
-    async def decompress(cls, data: bytes) -> bytes:
+    @staticmethod
+    def _decompress(data: bytes) -> bytes:
+        if deflate is not None:
+            try:
+                return deflate.gzip_decompress(data)
+            except deflate.DeflateError as err:
+                raise ValueError(str(err))
         return gzip.decompress(data)
 
-    @classmethod
-    async def compress_file(cls, src: Path, dst: Path) -> None:
+    @staticmethod
+    def _compress_file(src: Path, dst: Path) -> None:
         with src.open('rb') as rc:
             with gzip.open(dst.resolve().as_posix(), 'wb', compresslevel=9) as wc:
                 while line := rc.read(1 << 24):
                     wc.write(line)
 
-    @classmethod
-    async def decompress_file(cls, src: Path, dst: Path) -> None:
+    @staticmethod
+    def _decompress_file(src: Path, dst: Path) -> None:
         with gzip.open(src.resolve().as_posix(), 'rb') as rc:
             with dst.open('wb') as wc:
                 while line := rc.read(1 << 24):
                     wc.write(line)
 
 
+class ZstdCompressor(BaseCompressor):
+    """Requires `zstandard` package. Fast, but never proposed automatically, so peer must support it"""
+    type_id = 0x02
+    level = 1
+
+    @classmethod
+    def decompressor(cls):
+        return ZstdDecompressor()
+
+    @staticmethod
+    def _compress(data: bytes) -> bytes:
+        return zstandard.ZstdCompressor(level=ZstdCompressor.level).compress(data)
+
+    @staticmethod
+    def _decompress(data: bytes) -> bytes:
+        try:
+            # decompressobj() also accepts frames written without content size
+            return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+        except zstandard.ZstdError as err:
+            raise ValueError(str(err))
+
+    @staticmethod
+    def _compress_file(src: Path, dst: Path) -> None:
+        with src.open('rb') as rc, dst.open('wb') as wc:
+            zstandard.ZstdCompressor(level=ZstdCompressor.level).copy_stream(rc, wc)
+
+    @staticmethod
+    def _decompress_file(src: Path, dst: Path) -> None:
+        with src.open('rb') as rc, dst.open('wb') as wc:
+            try:
+                zstandard.ZstdDecompressor().copy_stream(rc, wc)
+            except zstandard.ZstdError as err:
+                raise ValueError(str(err))
+
+
+class LZ4Compressor(BaseCompressor):
+    """Requires `lz4` package. Fast, but never proposed automatically, so peer must support it"""
+    type_id = 0x03
+    level = 0
+
+    @classmethod
+    def decompressor(cls):
+        return LZ4Decompressor()
+
+    @staticmethod
+    def _compress(data: bytes) -> bytes:
+        return lz4.frame.compress(data, compression_level=LZ4Compressor.level)
+
+    @staticmethod
+    def _decompress(data: bytes) -> bytes:
+        try:
+            return lz4.frame.decompress(data)
+        except RuntimeError as err:
+            raise ValueError(str(err))
+
+    @staticmethod
+    def _compress_file(src: Path, dst: Path) -> None:
+        with src.open('rb') as rc:
+            with lz4.frame.open(dst.resolve().as_posix(), 'wb', compression_level=LZ4Compressor.level) as wc:
+                while line := rc.read(1 << 24):
+                    wc.write(line)
+
+    @staticmethod
+    def _decompress_file(src: Path, dst: Path) -> None:
+        try:
+            with lz4.frame.open(src.resolve().as_posix(), 'rb') as rc:
+                with dst.open('wb') as wc:
+                    while line := rc.read(1 << 24):
+                        wc.write(line)
+        except RuntimeError as err:
+            raise ValueError(str(err))
+
+
 class Compressor:
     T_NONE = 0b0000
     T_GZIP = 0b0001
+    T_ZSTD = 0b0010
+    T_LZ4 = 0b0011
+    # Payloads up to this size are not worth compressing, gzip overhead outweighs the saved bytes
+    MIN_COMPRESS_SIZE = 4096
     compressors = {
         T_NONE: DummyCompressor,
         T_GZIP: GzipCompressor,
     }
+    # Optional compressors are only registered when their package is installed
+    if zstandard is not None:
+        compressors[T_ZSTD] = ZstdCompressor
+    if lz4 is not None:
+        compressors[T_LZ4] = LZ4Compressor
 
     @classmethod
     async def compress(cls, buff: bytes, compression: int = None) -> (bytes, int):
@@ -102,6 +367,14 @@ class Compressor:
         except (KeyError, ValueError, TypeError) as err:
             raise ValueError(f'Failed to decompress data: {str(err)}')
 
+    @classmethod
+    def get_decompressor(cls, compression: int):
+        """Returns incremental decompressor or None, see BaseCompressor.decompressor()"""
+        try:
+            return cls.compressors[compression].decompressor()
+        except KeyError as err:
+            raise ValueError(f'Failed to decompress data: {str(err)}')
+
     @classmethod
     async def compress_file(cls, src: Path, dst: Path, compression: int = None) -> int:
         try:
@@ -122,15 +395,15 @@ class Compressor:
 
     @classmethod
     async def propose_compression(cls, buff: Union[bytes, Path]):
-        if isinstance(buff, bytes):
-            if len(buff) > 4096:
+        if isinstance(buff, (bytes, bytearray, memoryview)):
+            if len(buff) > cls.MIN_COMPRESS_SIZE:
                 return cls.T_GZIP
             else:
                 return cls.T_NONE
 
         elif isinstance(buff, Path):
             s = os.path.getsize(buff.as_posix())
-            if s > 4096:
+            if s > cls.MIN_COMPRESS_SIZE:
                 return cls.T_GZIP
             else:
                 return cls.T_NONE
@@ -1,10 +1,20 @@
-import hashlib
+import hmac
 from asyncio import wait_for
 from datetime import datetime, timezone
-from typing import List
+from logging import getLogger
+from typing import List, Tuple
 
 from cats.events import Event
 
+logging = getLogger('CATS.Handshake')
+
+try:
+    from _hashlib import openssl_sha256 as sha256
+except ImportError:
+    from hashlib import sha256
+
+    logging.warning('OpenSSL sha256 is not available, falling back to builtin implementation')
+
 __all__ = [
     'HandshakeError',
     'Handshake',
@@ -23,23 +33,42 @@ class Handshake:
 
 class SHA256TimeHandshake(Handshake):
     def __init__(self, secret_key: bytes, valid_window: int = None, timeout: float = 5.0):
-        assert isinstance(secret_key, bytes) and secret_key
+        if not isinstance(secret_key, bytes) or not secret_key:
+            raise TypeError('secret_key must be non-empty bytes')
         self.secret_key = secret_key
         self.valid_window = valid_window or 1
         self.timeout = timeout
-        assert self.valid_window >= 1
+        if self.valid_window < 1:
+            raise ValueError('valid_window must be positive')
+        self._key_hasher = sha256(self.secret_key)
+        self._cache_time: int = -1
+        self._cache_hashes: List[str] = []
+        self._cache_digests: Tuple[bytes, ...] = ()
 
     def get_hashes(self) -> List[str]:
         time = round(datetime.now(tz=timezone.utc).timestamp() / 10) * 10
+        if time == self._cache_time:
+            return self._cache_hashes
+
+        hashes = []
+        for i in range(-self.valid_window, self.valid_window + 1):
+            hasher = self._key_hasher.copy()
+            hasher.update(str(time + i * 10).encode('utf-8'))
+            hashes.append(hasher.hexdigest())
+
+        self._cache_time, self._cache_hashes = time, hashes
+        self._cache_digests = tuple(h.encode('ascii') for h in hashes)
+        return hashes
 
-        return [
-            hashlib.sha256(self.secret_key + str(time + i * 10).encode('utf-8')).hexdigest()
-            for i in range(-self.valid_window, self.valid_window + 1)
-        ]
+    def get_digests(self) -> Tuple[bytes, ...]:
+        """Same as get_hashes(), but ascii encoded to compare raw handshake bytes against"""
+        self.get_hashes()
+        return self._cache_digests
 
     async def validate(self, server, conn) -> None:
         handshake: bytes = await wait_for(conn.stream.read_bytes(64), self.timeout)
-        if handshake.decode('utf-8') not in self.get_hashes():
+        # compare_digest() takes the same time for any mismatch, so the token can't be guessed byte by byte
+        if not any(hmac.compare_digest(handshake, digest) for digest in self.get_digests()):
             await conn.app.trigger(Event.ON_HANDSHAKE_FAIL, server=server, conn=conn, handshake=handshake)
             await conn.stream.write(b'\x00')
             raise HandshakeError('Invalid handshake')
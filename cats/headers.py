@@ -1,6 +1,6 @@
-from typing import Any, Dict, Union
+from typing import Any, Dict, Optional, Union
 
-import ujson
+import orjson
 
 from cats.errors import ProtocolError
 from cats.typing import Bytes
@@ -12,20 +12,86 @@ __all__ = [
 
 T_Headers = Union[Dict[str, Any], 'Headers']
 
+_EMPTY_ENCODED = b'{}'
+
 
 class Headers(dict):
+    # Cached encode() result, dropped by every mutating method
+    _encoded: Optional[bytes] = None
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        for key, value in self.items():
+        self._check_keys()
+        self._check_offset()
+
+    @classmethod
+    def _unchecked(cls, mapping: Dict[str, Any]) -> 'Headers':
+        """Builds Headers from a mapping which is known to have str keys only, e.g. decoded JSON object"""
+        obj = dict.__new__(cls)
+        dict.update(obj, mapping)
+        return obj
+
+    def _reset(self, mapping: Optional[Dict[str, Any]] = None) -> None:
+        """Replaces content with `mapping` in place, so a recycled owner keeps its Headers object"""
+        dict.clear(self)
+        self._encoded = None
+        if mapping:
+            dict.update(self, mapping)
+            self._check_keys()
+            self._check_offset()
+
+    def _check_keys(self) -> None:
+        for key in self:
             if not isinstance(key, str):
                 raise ValueError
 
-            if key == 'Offset' and (not isinstance(value, int) or value < 0):
-                raise ProtocolError('Invalid offset header')
+    def _check_offset(self) -> None:
+        if 'Offset' not in self:
+            return
+        offset = dict.__getitem__(self, 'Offset')
+        if not isinstance(offset, int) or offset < 0:
+            raise ProtocolError('Invalid offset header')
+
+    def __setitem__(self, key, value):
+        self._encoded = None
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self._encoded = None
+        super().__delitem__(key)
+
+    def pop(self, *args):
+        self._encoded = None
+        return super().pop(*args)
+
+    def popitem(self):
+        self._encoded = None
+        return super().popitem()
+
+    def clear(self):
+        self._encoded = None
+        super().clear()
+
+    def update(self, *args, **kwargs):
+        self._encoded = None
+        super().update(*args, **kwargs)
+
+    def setdefault(self, key, default=None):
+        self._encoded = None
+        return super().setdefault(key, default)
+
+    def __ior__(self, other):
+        # dict.__ior__ exists only since Python 3.9
+        self.update(other)
+        return self
 
     def encode(self) -> bytes:
-        return ujson.encode(self, ensure_ascii=False).encode('utf-8')
+        if self._encoded is None:
+            self._encoded = orjson.dumps(self) if self else _EMPTY_ENCODED
+        return self._encoded
 
     @classmethod
     def decode(cls, headers: Bytes) -> 'Headers':
-        return cls(ujson.decode(headers.decode('utf-8')))
+        result = cls._unchecked(orjson.loads(headers))
+        result._check_offset()
+        return result
@@ -1,4 +1,4 @@
-from typing import List, Type
+from typing import List, Tuple, Type
 
 __all__ = [
     'IdentityMeta',
@@ -8,16 +8,19 @@ __all__ = [
 
 class IdentityMeta(type):
     __identity_registry__: List[Type['Identity']] = []
+    # Read-only snapshot of the registry, rebuilt on every class creation
+    _identity_snapshot: Tuple[Type['Identity'], ...] = ()
 
     def __new__(mcs, name, bases, attrs):
         cls = super().__new__(mcs, name, bases, attrs)
         # noinspection PyTypeChecker
         IdentityMeta.__identity_registry__.append(cls)
+        IdentityMeta._identity_snapshot = tuple(IdentityMeta.__identity_registry__)
         return cls
 
     @property
     def identity_list(cls):
-        return IdentityMeta.__identity_registry__[:]
+        return IdentityMeta._identity_snapshot
 
 
 class Identity(metaclass=IdentityMeta):
@@ -1,13 +1,14 @@
-from typing import List, Type
+from typing import List, Tuple, Type
 
 
 class IdentityMeta(type):
     __identity_registry__: List[Type['Identity']] = []
+    _identity_snapshot: Tuple[Type['Identity'], ...] = ()
 
     def __new__(mcs, name, bases, attrs): ...
 
     @property
-    def identity_list(cls) -> List[Type['Identity']]: ...
+    def identity_list(cls) -> Tuple[Type['Identity'], ...]: ...
 
 
 class Identity(metaclass=IdentityMeta):
@@ -1,6 +1,8 @@
+from asyncio import gather
 from collections import defaultdict
-from inspect import isawaitable
-from typing import Callable, DefaultDict, Iterable, List, Optional, Union
+from functools import partial
+from inspect import isawaitable, iscoroutinefunction
+from typing import Callable, DefaultDict, Dict, Iterable, List, Optional, Set, Tuple, Union
 
 from cats.server.conn import Connection
 from cats.server.handlers import Api, HandlerFunc, HandlerItem
@@ -12,7 +14,9 @@ __all__ = [
 
 
 class Application:
-    __slots__ = ('_handlers', '_middleware', '_events', '_channels', 'idle_timeout', 'input_timeout')
+    __slots__ = (
+        '_handlers', '_middleware', '_events', '_channels', '_dispatch_cache', 'idle_timeout', 'input_timeout',
+    )
     INPUT_LIMIT: int = 3
 
     def __init__(self, apis: List[Api], middleware: List[Middleware] = None,
@@ -22,9 +26,9 @@ class Application:
                 default_error_handler,
             ]
 
-        self._middleware = middleware
-        self._events: DefaultDict[str, List[Callable]] = defaultdict(list)
-        self._channels: DefaultDict[str, List[Connection]] = defaultdict(list)
+        self._middleware: Tuple[Middleware, ...] = tuple(middleware)
+        self._events: DefaultDict[str, List[Tuple[Callable, bool]]] = defaultdict(list)
+        self._channels: DefaultDict[str, Set[Connection]] = defaultdict(set)
         self.idle_timeout = idle_timeout or 0
         self.input_timeout = input_timeout or 0
 
@@ -33,10 +37,48 @@ class Application:
             api.update(i)
 
         self._handlers = api.compute()
+        self._dispatch_cache: Dict[Tuple[int, int], HandlerFunc] = {}
 
     def get_handlers_by_id(self, handler_id: int) -> Optional[Union[List[HandlerItem], HandlerItem]]:
         return self._handlers.get(handler_id)
 
+    def resolve(self, handler_id: int, api_version: int) -> Optional[HandlerFunc]:
+        """
+        Returns handler callback for provided API version wrapped in middleware or None if it was not found.
+        Resolved callbacks are cached, handlers and middleware are not expected to change after Application init
+        """
+        handlers = self._handlers.get(handler_id)
+        if not handlers:
+            return None
+
+        # api_version is picked by client, so it is clamped to registered versions before it becomes a cache key.
+        # Only matched versions are cached, which keeps cache bounded by registered handler ranges
+        if isinstance(handlers, list):
+            last = handlers[-1]
+            key = (handler_id, min(api_version, last.version) if last.end_version is None else api_version)
+        else:
+            key = (handler_id, 0)
+        fn = self._dispatch_cache.get(key)
+        if fn is not None:
+            return fn
+
+        if isinstance(handlers, list):
+            for item in handlers:
+                end_version = api_version if item.end_version is None else item.end_version
+                if item.version <= api_version <= end_version:
+                    fn = item.callback
+                    break
+            else:
+                return None
+        else:
+            fn = handlers.callback
+
+        for middleware in self._middleware:
+            fn = partial(middleware, fn)
+
+        self._dispatch_cache[key] = fn
+        return fn
+
     def get_handler_id(self, handler: HandlerFunc) -> Optional[int]:
         for handler_id, handler_list in self._handlers.items():
             arr = handler_list if isinstance(handler_list, list) else [handler_list]
@@ -49,49 +91,64 @@ class Application:
         return list(self._channels.keys())
 
     def channel(self, name: str) -> Iterable[Connection]:
-        return (i for i in self._channels.get(name, []))
+        # Iterate over a snapshot: connections may leave the channel while caller awaits sends
+        return iter(tuple(self._channels.get(name, ())))
 
     def attach_conn_to_channel(self, conn: Connection, channel: str) -> None:
-        if conn not in self._channels[channel]:
-            self._channels[channel].append(conn)
+        self._channels[channel].add(conn)
 
     def detach_conn_from_channel(self, conn: Connection, channel: str) -> None:
-        if conn in self._channels[channel]:
-            self._channels[channel].remove(conn)
+        conns = self._channels.get(channel)
+        if conns is not None:
+            conns.discard(conn)
+            if not conns:
+                del self._channels[channel]
 
     def clear_channel(self, channel: str) -> None:
-        self._channels[channel].clear()
+        self._channels.pop(channel, None)
 
     def clear_all_channels(self) -> None:
         self._channels.clear()
 
     def remove_conn_from_channels(self, conn: Connection) -> None:
-        for channel_name in self.channels():
-            self.detach_conn_from_channel(conn, channel_name)
+        empty = []
+        for channel, conns in self._channels.items():
+            conns.discard(conn)
+            if not conns:
+                empty.append(channel)
+
+        for channel in empty:
+            del self._channels[channel]
 
     @property
-    def middleware(self) -> Iterable[Middleware]:
-        return (i for i in self._middleware)
+    def middleware(self) -> Tuple[Middleware, ...]:
+        return self._middleware
 
     def add_event_listener(self, event: str, callback: Callable) -> int:
-        self._events[event].append(callback)
+        self._events[event].append((callback, iscoroutinefunction(callback)))
         return id(callback)
 
     def remove_event_listener(self, event: str, callback: Union[int, Callable]) -> None:
-        if isinstance(callback, int):
-            for fn in list(self._events[event]):
-                if id(fn) == callback:
-                    break
-            else:
-                return None
-        else:
-            fn = callback
+        listeners = self._events.get(event)
+        if not listeners:
+            return None
 
-        if fn in self._events[event]:
-            self._events[event].remove(fn)
+        by_id = isinstance(callback, int)
+        for i, (fn, _) in enumerate(listeners):
+            if (id(fn) if by_id else fn) == callback:
+                del listeners[i]
+                break
 
     async def trigger(self, event: str, *args, **kwargs):
-        for fn in self._events.get(event, []):
+        listeners = self._events.get(event)
+        if not listeners:
+            return
+
+        pending = []
+        for fn, is_coroutine in listeners:
             res = fn(*args, **kwargs)
-            if isawaitable(fn):
-                await res
+            if is_coroutine or isawaitable(res):
+                pending.append(res)
+
+        if pending:
+            await gather(*pending)
@@ -1,9 +1,9 @@
-from asyncio import CancelledError, Future, Task, get_event_loop, shield, sleep
-from contextlib import asynccontextmanager
-from functools import partial
-from logging import getLogger
+import socket
+from asyncio import CancelledError, Future, Lock, Task, get_event_loop, shield, sleep
+from contextlib import contextmanager
+from logging import DEBUG, getLogger
 from random import randint
-from typing import Any, Dict, Iterable, List, Optional, Tuple
+from typing import Any, Dict, Iterable, Iterator, Optional, Set, Tuple
 
 from sentry_sdk import Scope, add_breadcrumb, capture_exception
 from tornado.iostream import IOStream, StreamClosedError
@@ -13,8 +13,10 @@ from cats.events import Event
 from cats.handshake import HandshakeError
 from cats.identity import Identity
 from cats.server.handlers import HandlerFunc
-from cats.server.request import BaseRequest, CancelInput, DownloadSpeed, Input, InputRequest, Ping, Request
-from cats.server.response import Pong, Response, StreamResponse
+from cats.server.request import (
+    BaseRequest, CancelInput, DownloadSpeed, Input, InputRequest, Ping, Request, StreamRequest,
+)
+from cats.server.response import DownloadResponse, Pong, Response, StreamResponse, response_pool
 from cats.typing import BytesAnyGen
 
 __all__ = [
@@ -23,17 +25,23 @@ __all__ = [
 
 logging = getLogger('CATS.Connection')
 
+# Linux only, other platforms send messages uncorked
+_TCP_CORK: Optional[int] = getattr(socket, 'TCP_CORK', None)
+
 
 class Connection:
     MAX_PLAIN_DATA_SIZE: int = 1 << 24
+    MIN_MESSAGE_ID: int = 17783
+    MAX_MESSAGE_ID: int = 35565
 
     __slots__ = (
         '_closed', 'stream', 'host', 'port', 'api_version', '_app', '_scope', 'download_speed',
-        '_identity', '_credentials', 'loop', 'input_deq', '_idle_timer', '_message_pool', 'is_sending',
+        '_identity', '_credentials', 'loop', 'input_deq', '_idle_timer', '_idle_deadline', '_message_pool',
+        '_write_lock', '_model_group', '_auth_group', '_next_message_id',
     )
 
     def __init__(self, stream: IOStream, address: Tuple[str, int], api_version: int, app):
-        logging.debug(f'New connection established: {address}')
+        logging.debug('New connection established: %s', address)
         self._closed: bool = False
         self.stream = stream
         self.host, self.port = address
@@ -42,11 +50,15 @@ class Connection:
         self._scope = Scope()
         self._identity: Optional[Identity] = None
         self._credentials: Any = None
+        self._model_group: Optional[str] = None
+        self._auth_group: Optional[str] = None
         self.loop = get_event_loop()
         self.input_deq: Dict[int, Input] = {}
         self._idle_timer: Optional[Future] = None
-        self._message_pool: List[int] = []
-        self.is_sending: bool = False
+        self._idle_deadline: float = 0.0
+        self._message_pool: Set[int] = set()
+        self._next_message_id: int = randint(self.MIN_MESSAGE_ID, self.MAX_MESSAGE_ID)
+        self._write_lock = Lock()
         self.download_speed: int = 0
 
     @property
@@ -57,8 +69,12 @@ class Connection:
     def app(self):
         return self._app
 
+    @property
+    def is_sending(self) -> bool:
+        return self._write_lock.locked()
+
     async def init(self):
-        logging.debug(f'{self} initialized')
+        logging.debug('%s initialized', self)
 
     async def start(self, ping=False):
         if ping:
@@ -79,15 +95,17 @@ class Connection:
             await pong.send_to_conn(self)
 
     async def set_download_speed(self, speed: int = 0):
-        await self.stream.write(b'\x05')
-        await self.stream.write(speed.to_bytes(4, 'big', signed=False))
+        await DownloadResponse(speed).send_to_conn(self)
 
     async def send(self, handler_id: int, data: Any = None, message_id: int = None, compression: int = None, *,
                    headers=None, status=None):
-        response = Response(data=data, compression=compression, headers=headers, status=status)
-        response.handler_id = handler_id
-        response.message_id = self._get_free_message_id() if message_id is None else message_id
-        await response.send_to_conn(self)
+        response = response_pool.acquire(data=data, compression=compression, headers=headers, status=status)
+        try:
+            response.handler_id = handler_id
+            response.message_id = self._get_free_message_id() if message_id is None else message_id
+            await response.send_to_conn(self)
+        finally:
+            response_pool.release(response)
 
     async def send_stream(self, handler_id: int, data: BytesAnyGen, data_type: int,
                           message_id: int = None, compression: int = None, *,
@@ -106,31 +124,32 @@ class Connection:
 
     @property
     def conns_with_same_identity(self) -> Iterable['Connection']:
-        return self.app.channel(f'model_{self._identity.model_name}:{self._identity.id}')
+        return self.app.channel(self._auth_group)
 
     @property
     def conns_with_same_model(self) -> Iterable['Connection']:
-        return self.app.channel(f'model_{self._identity.model_name}')
+        return self.app.channel(self._model_group)
 
     async def tick(self, request: BaseRequest):
-        if isinstance(request, DownloadSpeed):
-            limit = request.data
-            if not limit or 1024 <= limit <= 33_554_432:
-                self.download_speed = limit
-            else:
-                logging.error('Unsupported download speed limit')
-        elif isinstance(request, Ping):
-            await Pong().send_to_conn(self)
-            logging.debug(f'Ping {request.data.send_time} [-] {request.data.recv_time}')
-        elif isinstance(request, CancelInput):
-            if request.message_id in self.input_deq:
-                self.input_deq[request.message_id].cancel()
-        elif isinstance(request, Request):
-            await self.handle_request(request)
-        elif isinstance(request, InputRequest):
-            await self.handle_input_answer(request)
-        else:
+        name = self._tick_handlers.get(request.type_id)
+        if name is None:
             raise ProtocolError('Unsupported request')
+        await getattr(self, name)(request)
+
+    async def handle_download_speed(self, request: DownloadSpeed):
+        limit = request.data
+        if not limit or 1024 <= limit <= 33_554_432:
+            self.download_speed = limit
+        else:
+            logging.error('Unsupported download speed limit')
+
+    async def handle_ping(self, request: Ping):
+        await Pong().send_to_conn(self)
+        logging.debug('Ping %s [-] %s', request.data.send_time, request.data.recv_time)
+
+    async def handle_cancel_input(self, request: CancelInput):
+        if request.message_id in self.input_deq:
+            self.input_deq[request.message_id].cancel()
 
     @property
     def identity(self) -> Optional[Identity]:
@@ -154,10 +173,10 @@ class Connection:
         self._identity: Optional[Identity] = identity
         self._credentials = credentials
 
-        model_group = f'model_{identity.model_name}'
-        auth_group = f'{model_group}:{identity.id}'
-        self.attach_to_channel(model_group)
-        self.attach_to_channel(auth_group)
+        self._model_group = f'model_{identity.model_name}'
+        self._auth_group = f'{self._model_group}:{identity.id}'
+        self.attach_to_channel(self._model_group)
+        self.attach_to_channel(self._auth_group)
 
         self._scope.set_user(self.identity_scope_user)
         add_breadcrumb(message='Sign in', data={
@@ -166,19 +185,23 @@ class Connection:
             'instance': repr(identity),
         })
 
-        logging.debug(f'Signed in as {identity.__class__.__name__} <{self.host}:{self.port}>')
+        if logging.isEnabledFor(DEBUG):
+            logging.debug('Signed in as %s <%s:%s>', identity.__class__.__name__, self.host, self.port)
 
     def sign_out(self):
-        logging.debug(f'Signed out from {self.identity.__class__.__name__} <{self.host}:{self.port}>')
-        if self.signed_in():
-            model_group = f'model_{self.identity.model_name}'
-            auth_group = f'{model_group}:{self._identity.id}'
+        # close() signs out every connection, anonymous ones have no scope user or channels to reset
+        if not self.signed_in():
+            return self
 
-            self.detach_from_channel(auth_group)
-            self.detach_from_channel(model_group)
+        if logging.isEnabledFor(DEBUG):
+            logging.debug('Signed out from %s <%s:%s>', self.identity.__class__.__name__, self.host, self.port)
+        self.detach_from_channel(self._auth_group)
+        self.detach_from_channel(self._model_group)
 
-            self._identity = None
-            self._credentials = None
+        self._identity = None
+        self._credentials = None
+        self._model_group = None
+        self._auth_group = None
 
         self._scope.set_user(self.identity_scope_user)
         add_breadcrumb(message='Sign out')
@@ -203,10 +226,8 @@ class Connection:
         if message_id in self._message_pool:
             raise ProtocolError('Provided message_id already in use')
         fn = await self.dispatch(request)
-        for middleware in self.app.middleware:
-            fn = partial(middleware, fn)
 
-        self._message_pool.append(message_id)
+        self._message_pool.add(message_id)
         try:
             result = await shield(fn(request))
             if result is not None:
@@ -222,33 +243,22 @@ class Connection:
         except Exception as err:
             capture_exception(err, scope=self._scope)
             await self.app.trigger(Event.ON_HANDLE_ERROR, request=request, exc=err)
-        self._message_pool.remove(message_id)
+        self._message_pool.discard(message_id)
 
     async def recv(self):
         self.reset_idle_timer()
-        message_type: int = int.from_bytes(await self.stream.read_bytes(1), 'big', signed=False)
-        request_class = BaseRequest.get_class_by_type_id(message_type)
+        message_type: int = (await self.stream.read_bytes(1))[0]
+        request_class = BaseRequest.__type_table__[message_type]
         if request_class is None:
             raise ProtocolError(f'Received unknown message type [first byte = {hex(message_type)[2:]}]')
 
         return await request_class.recv_from_conn(self)
 
     async def dispatch(self, request: Request) -> HandlerFunc:
-        handlers = self.app.get_handlers_by_id(request.handler_id)
-        if not handlers:
+        fn = self.app.resolve(request.handler_id, self.api_version)
+        if fn is None:
             raise ProtocolError(f'Handler with id {request.handler_id} not found')
 
-        if isinstance(handlers, list):
-            for item in handlers:
-                end_version = request.conn.api_version if item.end_version is None else item.end_version
-                if item.version <= request.conn.api_version <= end_version:
-                    fn = item.callback
-                    break
-            else:
-                raise ProtocolError(f'Handler with id {request.handler_id} not found')
-        else:
-            fn = handlers.callback
-
         return fn
 
     def close(self, exc: Exception = None):
@@ -259,38 +269,85 @@ class Connection:
 
         self.sign_out()
         if exc and not isinstance(exc, (HandshakeError,)):
-            logging.error(f'Connection {(self.host, self.port)} closed')
+            logging.error('Connection %s closed', (self.host, self.port))
             logging.error(exc)
             capture_exception(exc, scope=self._scope)
 
         if self._idle_timer is not None:
             self._idle_timer.cancel()
             self._idle_timer = None
+        # Answers can't arrive anymore, release waiting handlers and their timers right away
+        for inp in tuple(self.input_deq.values()):
+            inp.cancel()
         self.stream.close(exc)
-        logging.debug(f'{self} closed: {exc = }', exc_info=exc)
+        logging.debug('%s closed: exc = %r', self, exc, exc_info=exc)
 
     def __str__(self) -> str:
         return f'CATS.Connection: {self.host}:{self.port} api@{self.api_version}'
 
     def reset_idle_timer(self):
-        if self.app.idle_timeout > 0:
-            if self._idle_timer is not None:
-                self._idle_timer.cancel()
-
-            self._idle_timer = self.loop.call_later(self.app.idle_timeout, partial(self.close, TimeoutError()))
+        timeout = self.app.idle_timeout
+        if timeout > 0:
+            # Called per message, so only deadline is moved here. Timer is rescheduled once it fires early
+            self._idle_deadline = self.loop.time() + timeout
+            if self._idle_timer is None:
+                self._idle_timer = self.loop.call_at(self._idle_deadline, self._on_idle_timeout)
+
+    def _on_idle_timeout(self):
+        if self.loop.time() < self._idle_deadline:
+            self._idle_timer = self.loop.call_at(self._idle_deadline, self._on_idle_timeout)
+        else:
+            self._idle_timer = None
+            self.close(TimeoutError())
 
     def _get_free_message_id(self) -> int:
-        while True:
-            message_id = randint(17783, 35565)
-            if message_id not in self._message_pool:
-                break
+        # One full turn of the counter visits every id, if all of them are busy waiting won't help
+        for _ in range(self.MAX_MESSAGE_ID - self.MIN_MESSAGE_ID + 1):
+            message_id = self._next_message_id
+            if message_id < self.MAX_MESSAGE_ID:
+                self._next_message_id = message_id + 1
+            else:
+                self._next_message_id = self.MIN_MESSAGE_ID
 
-        return message_id
+            if message_id not in self._message_pool:
+                return message_id
+
+        raise ProtocolError('No free message_id left')
+
+    def lock_write(self) -> Lock:
+        """Lock to hold while writing a message, so messages sent concurrently don't interleave"""
+        return self._write_lock
+
+    @contextmanager
+    def cork(self) -> Iterator[None]:
+        """
+        Holds back partial TCP segments while a message is written in several parts,
+        so small header isn't sent in a packet of its own ahead of the payload.
+        Throttled connections are left uncorked, their chunks are paced on purpose
+        """
+        sock = self.stream.socket
+        if _TCP_CORK is None or self.download_speed or sock is None \
+                or sock.family not in (socket.AF_INET, socket.AF_INET6):
+            yield
+            return
 
-    @asynccontextmanager
-    async def lock_write(self):
-        while self.is_sending:
-            await sleep(0.05)
-        self.is_sending = True
-        yield
-        self.is_sending = False
+        sock.setsockopt(socket.IPPROTO_TCP, _TCP_CORK, 1)
+        try:
+            yield
+        finally:
+            try:
+                sock.setsockopt(socket.IPPROTO_TCP, _TCP_CORK, 0)
+            except OSError:
+                # Socket was closed while message was being sent
+                pass
+
+    # Request type_id -> tick handler name, so tick() dispatches with one lookup instead of an isinstance chain.
+    # Names are resolved on instance, so handlers overridden in subclasses are respected
+    _tick_handlers = {
+        DownloadSpeed.type_id: 'handle_download_speed',
+        Ping.type_id: 'handle_ping',
+        CancelInput.type_id: 'handle_cancel_input',
+        Request.type_id: 'handle_request',
+        StreamRequest.type_id: 'handle_request',
+        InputRequest.type_id: 'handle_input_answer',
+    }
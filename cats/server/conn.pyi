@@ -1,6 +1,5 @@
-from asyncio import BaseEventLoop, Future, Task, get_event_loop
-from contextlib import asynccontextmanager
-from typing import Any, Dict, List, Optional, Tuple
+from asyncio import BaseEventLoop, Future, Lock, Task, get_event_loop
+from typing import Any, ContextManager, Dict, Optional, Set, Tuple
 
 from sentry_sdk import Scope
 from tornado.iostream import IOStream
@@ -9,16 +8,19 @@ from cats.headers import T_Headers
 from cats.identity import Identity
 from cats.server.app import Application
 from cats.server.handlers import HandlerFunc
-from cats.server.request import BaseRequest, Input, InputRequest, Request
+from cats.server.request import BaseRequest, CancelInput, DownloadSpeed, Input, InputRequest, Ping, Request
 from cats.typing import BytesAnyGen
 
 
 class Connection:
     MAX_PLAIN_DATA_SIZE: int
+    MIN_MESSAGE_ID: int
+    MAX_MESSAGE_ID: int
 
     __slots__ = (
         '_closed', 'stream', 'host', 'port', 'api_version', '_app', '_scope', 'download_speed',
-        '_identity', '_credentials', 'loop', 'input_deq', '_idle_timer', '_message_pool', 'is_sending',
+        '_identity', '_credentials', 'loop', 'input_deq', '_idle_timer', '_idle_deadline', '_message_pool',
+        '_write_lock', '_model_group', '_auth_group', '_next_message_id',
     )
 
     def __init__(self, stream: IOStream, address: Tuple[str, int], api_version: int, app: Application):
@@ -31,16 +33,23 @@ class Connection:
         self._scope: Scope = Scope()
         self._identity: Optional[Identity] = None
         self._credentials: Any = None
+        self._model_group: Optional[str] = None
+        self._auth_group: Optional[str] = None
         self.loop: BaseEventLoop = get_event_loop()
         self.input_deq: Dict[int, Input] = {}
         self._idle_timer: Optional[Future] = None
-        self._message_pool: List[int] = []
-        self.is_sending: bool = False
+        self._idle_deadline: float = 0.0
+        self._message_pool: Set[int] = set()
+        self._next_message_id: int
+        self._write_lock: Lock = Lock()
         self.download_speed: int = 0
 
     @property
     def is_open(self) -> bool: ...
 
+    @property
+    def is_sending(self) -> bool: ...
+
     @property
     def app(self) -> Application: ...
 
@@ -67,6 +76,12 @@ class Connection:
 
     async def tick(self, request: BaseRequest) -> None: ...
 
+    async def handle_download_speed(self, request: DownloadSpeed) -> None: ...
+
+    async def handle_ping(self, request: Ping) -> None: ...
+
+    async def handle_cancel_input(self, request: CancelInput) -> None: ...
+
     @property
     def identity(self) -> Optional[Identity]: ...
 
@@ -99,7 +114,10 @@ class Connection:
 
     def reset_idle_timer(self) -> None: ...
 
+    def _on_idle_timeout(self) -> None: ...
+
     def _get_free_message_id(self) -> int: ...
 
-    @asynccontextmanager
-    async def lock_write(self): ...
+    def lock_write(self) -> Lock: ...
+
+    def cork(self) -> ContextManager[None]: ...
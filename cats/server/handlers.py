@@ -1,10 +1,9 @@
 from abc import ABCMeta
 from collections import defaultdict
-from dataclasses import dataclass
 from types import GeneratorType
-from typing import Any, Awaitable, Callable, DefaultDict, Dict, List, Optional, Set, Tuple, Type, Union
+from typing import Any, Awaitable, Callable, DefaultDict, Dict, FrozenSet, List, Optional, Set, Tuple, Type, Union
 
-import ujson
+import orjson
 
 from cats.codecs import Codec, Json
 from cats.headers import Headers
@@ -33,13 +32,32 @@ HandlerFunc = Callable[[Request], Awaitable[Optional[Response]]]
 T_Headers = Union[Dict[str, Any], Headers]
 
 
-@dataclass
 class HandlerItem:
-    id: int
-    name: str
-    callback: Callable
-    version: Optional[int] = None
-    end_version: Optional[int] = None
+    # Written by hand instead of @dataclass, which supports slots only since Python 3.10
+    __slots__ = ('id', 'name', 'callback', 'version', 'end_version')
+
+    # noinspection PyShadowingBuiltins
+    def __init__(self, id: int, name: str, callback: Callable,
+                 version: Optional[int] = None, end_version: Optional[int] = None):
+        self.id = id
+        self.name = name
+        self.callback = callback
+        self.version = version
+        self.end_version = end_version
+
+    def _astuple(self) -> tuple:
+        return self.id, self.name, self.callback, self.version, self.end_version
+
+    def __eq__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return self._astuple() == other._astuple()
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return (f'{self.__class__.__name__}(id={self.id!r}, name={self.name!r}, callback={self.callback!r}, '
+                f'version={self.version!r}, end_version={self.end_version!r})')
 
 
 class Api:
@@ -106,7 +124,7 @@ class Handler(metaclass=ABCMeta):
 
     Loader: Optional[Type[BaseSerializer]] = None
     Dumper: Optional[Type[BaseSerializer]] = None
-    required_type: Optional[Union[int, Tuple[int], Set[int], List[int]]] = None
+    required_type: Optional[Union[int, Tuple[int], Set[int], List[int], FrozenSet[int]]] = None
 
     def __init__(self, request: Request):
         self.request = request
@@ -114,6 +132,13 @@ class Handler(metaclass=ABCMeta):
     # noinspection PyShadowingBuiltins
     def __init_subclass__(cls, /, api: Api = None, id: int = None,
                           name: str = None, version: int = None, end_version: int = None):
+        # Normalized once per class, so prepare() only does a set lookup per request
+        types = cls.__dict__.get('required_type')
+        if isinstance(types, int):
+            cls.required_type = frozenset((types,))
+        elif types is not None:
+            cls.required_type = frozenset(types)
+
         if api is None:
             # abstract, not registered handler
             return
@@ -136,19 +161,12 @@ class Handler(metaclass=ABCMeta):
         return await h.handle()
 
     async def prepare(self) -> None:
-        if self.required_type is not None:
-            await self._check_required_type()
+        if self.required_type is not None and self.request.data_type not in self.required_type:
+            raise ValueError('Received payload type is not acceptable')
 
     async def handle(self):
         raise NotImplementedError
 
-    async def _check_required_type(self):
-        types = self.required_type
-        if isinstance(types, int):
-            types = (types,)
-        if self.request.data_type not in types:
-            raise ValueError('Received payload type is not acceptable')
-
     async def json_load(self, *, many: bool = False) -> Json:
         if self.request.data_type != Codec.T_JSON:
             raise TypeError('Unsupported data type. Expected JSON')
@@ -170,8 +188,13 @@ class Handler(metaclass=ABCMeta):
 
         if self.Dumper is not None:
             data = self.Dumper(data, many=many).data
-        else:
-            ujson.encode(data)
+
+        # Checked inside handler, so middleware can answer with an error. Once response is being sent
+        # encoding error can't reach client anymore
+        try:
+            orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError as err:
+            raise TypeError(f'Data is not JSON serializable: {err}')
 
         return Response(data=data, headers=headers, status=status)
 
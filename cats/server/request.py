@@ -1,18 +1,17 @@
-import os
 from abc import ABCMeta
-from asyncio import Future
+from asyncio import Future, get_running_loop
 from datetime import datetime, timezone
+from io import BytesIO
 from struct import Struct
-
-import pytz
+from time import time
 
 from cats.codecs import Codec
-from cats.compression import Compressor
+from cats.compression import EXECUTOR_THRESHOLD, Compressor
 from cats.errors import MalformedDataError, ProtocolError
 from cats.headers import Headers
 from cats.server.response import CancelInputResponse, InputResponse
 from cats.typing import PingData
-from cats.utils import tmp_file
+from cats.utils import buffer_pool, tmp_file
 
 __all__ = [
     'Input',
@@ -25,6 +24,9 @@ __all__ = [
     'Ping',
 ]
 
+# Length prefix of headers and data chunks in stream messages
+_CHUNK_LENGTH = Struct('>I')
+
 
 class Input:
     def __init__(self, future, timeout, conn, message_id, bypass_count):
@@ -37,7 +39,8 @@ class Input:
             self.timer = self.conn.loop.call_later(timeout, self.cancel)
 
     def cancel(self):
-        if self.timer is not None and not self.timer.done():
+        # TimerHandle has no done(), cancelling one that already fired is a no-op
+        if self.timer is not None:
             self.timer.cancel()
             self.timer = None
         if not self.future.done():
@@ -45,9 +48,10 @@ class Input:
         self.conn.input_deq.pop(self.message_id, None)
 
 
-class BaseRequest(dict):
+class BaseRequest:
     __slots__ = ('conn', 'message_id', 'headers', 'data',)
     __registry__ = {}
+    __type_table__ = [None] * 256
     type_id: int
     struct: Struct
     HEADER_SEPARATOR = b'\x00\x00'
@@ -59,7 +63,6 @@ class BaseRequest(dict):
         if headers is not None and not isinstance(headers, dict):
             raise MalformedDataError('Invalid Headers provided')
 
-        super().__init__()
         self.conn = conn
         self.message_id = message_id
         self.headers = Headers(headers or {})
@@ -69,12 +72,17 @@ class BaseRequest(dict):
     def __init_subclass__(cls, /, type_id=0, struct=None, abstract=False):
         if abstract:
             return
-        assert isinstance(type_id, int) and type_id >= 0, f'Invalid {type_id = } provided'
+        assert isinstance(type_id, int) and 0 <= type_id <= 0xFF, f'Invalid {type_id = } provided'
         assert isinstance(struct, Struct), f'Invalid {struct = } provided'
         assert type_id not in cls.__registry__, f'Request with {type_id = } already assigned'
         cls.__registry__[type_id] = cls
+        cls.__type_table__[type_id] = cls
         setattr(cls, 'type_id', type_id)
         setattr(cls, 'struct', struct)
+        # Bound once, so recv_from_conn doesn't resolve cls.struct.* per message
+        setattr(cls, '_unpack', struct.unpack)
+        setattr(cls, '_unpack_from', struct.unpack_from)
+        setattr(cls, '_size', struct.size)
 
     @property
     def status(self):
@@ -94,7 +102,9 @@ class BaseRequest(dict):
 
     @classmethod
     def get_class_by_type_id(cls, message_type):
-        return cls.__registry__.get(message_type)
+        if 0 <= message_type <= 0xFF:
+            return cls.__type_table__[message_type]
+        return None
 
     async def input(self, data=None, data_type=None, compression=None, *,
                     headers=None, status=None, bypass_limit=False, bypass_count=False, timeout=None):
@@ -107,10 +117,10 @@ class BaseRequest(dict):
                 k = min(self.conn.input_deq.keys())
                 self.conn.input_deq[k].cancel()
 
-        inp = Input(fut, timeout, self.conn, self.message_id, bypass_count)
         if self.message_id in self.conn.input_deq:
             raise ProtocolError(f'Input query with MID {self.message_id} already exists')
 
+        inp = Input(fut, timeout, self.conn, self.message_id, bypass_count)
         self.conn.input_deq[self.message_id] = inp
         response = InputResponse(data, compression=compression, data_type=data_type, headers=headers, status=status)
         response.message_id = self.message_id
@@ -138,51 +148,150 @@ class BasicRequest(BaseRequest, metaclass=ABCMeta, abstract=True):
             if self.data_type != Codec.T_FILE:
                 raise ProtocolError(f'Attempted to send message larger than {self.conn.MAX_PLAIN_DATA_SIZE}b')
 
-            src, dst = tmp_file(), tmp_file()
-
+            dst = tmp_file()
             try:
-                with src.open('wb') as fh:
-                    while left > 0:
-                        self.conn.reset_idle_timer()
-                        chunk = await self.conn.stream.read_bytes(min(left, 1 << 20), partial=True)
-                        left -= len(chunk)
-                        fh.write(chunk)
-
-                await Compressor.decompress_file(src, dst, compression=self.compression)
+                await self._recv_decompressed(dst, left)
                 self.data = await Codec.decode(dst, self.data_type, self.headers)
             except Exception:
                 dst.unlink(missing_ok=True)
                 raise
-            finally:
-                src.unlink(missing_ok=True)
+        elif left <= buffer_pool.size:
+            # Codecs copy what they keep, so payload can be received into a pooled buffer and decoded from it
+            with buffer_pool.buffer() as buff, memoryview(buff) as view:
+                await self._recv_into(view[:left])
+                data = await self._decompress(view[:left], self.conn.MAX_PLAIN_DATA_SIZE)
+                self.data = await Codec.decode(data, self.data_type, self.headers)
         else:
-            buff = bytearray()
-            while left > 0:
-                self.conn.reset_idle_timer()
-                chunk = await self.conn.stream.read_bytes(min(left, 1 << 20), partial=True)
-                left -= len(chunk)
-                buff.extend(chunk)
+            # Payload size is known and bounded by MAX_PLAIN_DATA_SIZE, so the buffer is allocated once
+            buff = bytearray(left)
+            with memoryview(buff) as view:
+                await self._recv_into(view)
 
-            buff = await Compressor.decompress(buff, compression=self.compression)
+            buff = await self._decompress(buff, self.conn.MAX_PLAIN_DATA_SIZE)
             self.data = await Codec.decode(buff, self.data_type, self.headers)
 
+    async def _decompress(self, data, limit):
+        """
+        Decompresses in-memory payload piece by piece, so ProtocolError is raised
+        as soon as output grows over `limit` instead of after whole payload is inflated
+        """
+        if self.compression == Compressor.T_NONE:
+            return data
+
+        decompressor = Compressor.get_decompressor(self.compression)
+        if decompressor is None:
+            data = await Compressor.decompress(data, compression=self.compression)
+            self._check_limit(len(data), limit)
+            return data
+
+        if len(data) > EXECUTOR_THRESHOLD:
+            return await get_running_loop().run_in_executor(None, self._inflate, decompressor, data, limit)
+        return self._inflate(decompressor, data, limit)
+
+    def _inflate(self, decompressor, data, limit):
+        result = bytearray()
+        for chunk in decompressor.decompress(data):
+            self._check_limit(len(result) + len(chunk), limit)
+            result += chunk
+        chunk = decompressor.flush()
+        self._check_limit(len(result) + len(chunk), limit)
+        result += chunk
+        return result
+
+    async def _recv_into(self, view):
+        pos, size = 0, len(view)
+        while pos < size:
+            self.conn.reset_idle_timer()
+            pos += await self.conn.stream.read_into(view[pos:pos + min(size - pos, 1 << 20)], partial=True)
+
+    async def _recv_decompressed(self, dst, size):
+        """
+        Receives `size` bytes of compressed payload into `dst` file and returns its decompressed size.
+        Payload is decompressed on arrival when compressor allows it, otherwise it goes through a temporary file
+        """
+        decompressor = Compressor.get_decompressor(self.compression)
+        if decompressor is not None:
+            with dst.open('wb') as fh:
+                return await self._recv_to_file(fh, size, decompressor)
+
+        src = tmp_file()
+        try:
+            with src.open('wb') as fh:
+                await self._recv_to_file(fh, size)
+            await Compressor.decompress_file(src, dst, compression=self.compression)
+            return dst.stat().st_size
+        finally:
+            src.unlink(missing_ok=True)
+
+    async def _recv_to_file(self, fh, size, decompressor=None, limit=None):
+        """
+        Reads `size` bytes from stream straight into a pooled buffer and writes them to `fh`,
+        through `decompressor` if provided. Returns amount of bytes written.
+        Raises ProtocolError as soon as more than `limit` bytes would be written
+        """
+        written = 0
+        with buffer_pool.buffer() as buff:
+            view = memoryview(buff)
+            while size > 0:
+                self.conn.reset_idle_timer()
+                n = await self.conn.stream.read_into(view[:min(size, len(view))], partial=True)
+                size -= n
+                if decompressor is None:
+                    written = self._check_limit(written + n, limit)
+                    fh.write(view[:n])
+                    continue
+                for chunk in decompressor.decompress(view[:n]):
+                    written = self._check_limit(written + len(chunk), limit)
+                    fh.write(chunk)
+
+        if decompressor is not None:
+            chunk = decompressor.flush()
+            written = self._check_limit(written + len(chunk), limit)
+            fh.write(chunk)
+        return written
+
+    def _check_limit(self, size, limit):
+        if limit is not None and size > limit:
+            raise ProtocolError(f'Attempted to send message larger than {self.conn.MAX_PLAIN_DATA_SIZE}b')
+        return size
+
 
 class Request(BasicRequest, type_id=0x00, struct=Struct('>HHQBBI')):
-    __slots__ = ('handler_id', 'send_time', 'data_type', 'data_len', 'compression')
+    __slots__ = ('handler_id', '_send_time', '_send_time_ms')
 
     def __init__(self, conn, message_id, handler_id, data_type,
                  send_time=None, compression=0, data_len=0, *, headers=None, status=None):
         self.handler_id = handler_id
-        self.send_time = send_time or datetime.now(timezone.utc)
+        self.send_time = send_time
         super().__init__(conn=conn, message_id=message_id,
                          compression=compression, data_type=data_type, data_len=data_len,
                          headers=headers, status=status)
 
+    @property
+    def send_time(self):
+        # datetime is built only when asked, wire format keeps milliseconds since epoch
+        if self._send_time is None:
+            self._send_time = datetime.fromtimestamp(self._send_time_ms / 1000, tz=timezone.utc)
+        return self._send_time
+
+    @send_time.setter
+    def send_time(self, value=None):
+        if value is None:
+            self._send_time, self._send_time_ms = None, round(time() * 1000)
+        elif isinstance(value, datetime):
+            self._send_time, self._send_time_ms = value, round(value.timestamp() * 1000)
+        else:
+            self._send_time, self._send_time_ms = None, value
+
+    @property
+    def send_time_ms(self):
+        return self._send_time_ms
+
     @classmethod
     async def recv_from_conn(cls, conn):
         conn.reset_idle_timer()
-        buff = await conn.stream.read_bytes(cls.struct.size)
-        handler_id, message_id, send_time, data_type, compression, data_len = cls.struct.unpack(buff)
+        buff = await conn.stream.read_bytes(cls._size)
+        handler_id, message_id, send_time, data_type, compression, data_len = cls._unpack(buff)
 
         headers = await conn.stream.read_until(cls.HEADER_SEPARATOR, data_len)
         data_len -= len(headers)
@@ -192,7 +301,7 @@ class Request(BasicRequest, type_id=0x00, struct=Struct('>HHQBBI')):
             conn=conn,
             message_id=message_id,
             handler_id=handler_id,
-            send_time=datetime.fromtimestamp(send_time / 1000, tz=timezone.utc),
+            send_time=send_time,
             data_type=data_type,
             compression=compression,
             data_len=data_len,
@@ -203,14 +312,18 @@ class Request(BasicRequest, type_id=0x00, struct=Struct('>HHQBBI')):
 
 
 class StreamRequest(Request, type_id=0x01, struct=Struct('>HHQBB')):
+    __slots__ = ()
+
     def __init__(self, conn, message_id, handler_id, data_type, send_time=None):
         super().__init__(conn, message_id, handler_id, data_type, send_time)
 
     @classmethod
     async def recv_from_conn(cls, conn):
         conn.reset_idle_timer()
-        buff = await conn.stream.read_bytes(cls.struct.size)
-        handler_id, message_id, send_time, data_type, compression = cls.struct.unpack(buff)
+        # Headers length prefix is read together with the message header, one await instead of two
+        buff = await conn.stream.read_bytes(cls._size + _CHUNK_LENGTH.size)
+        handler_id, message_id, send_time, data_type, compression = cls._unpack_from(buff)
+        headers_size, = _CHUNK_LENGTH.unpack_from(buff, cls._size)
 
         request = cls(
             conn=conn,
@@ -221,71 +334,92 @@ class StreamRequest(Request, type_id=0x01, struct=Struct('>HHQBB')):
         )
         request.compression = compression
 
-        headers_size = int.from_bytes(await conn.stream.read_bytes(4), 'big', signed=False)
         request.headers = Headers.decode(await conn.stream.read_bytes(headers_size))
         await request.recv_data()
         return request
 
     async def recv_data(self):
-        data_len = 0
-        buff = tmp_file()
-        try:
-            with buff.open('wb') as fh:
-                self.conn.reset_idle_timer()
-                while chunk_size := int.from_bytes(await self.conn.stream.read_bytes(4), 'big', signed=False):
-                    if chunk_size > 1 << 24:
-                        data_len += await self._recv_large_chunk(fh, chunk_size)
-                    else:
-                        data_len += await self._recv_small_chunk(fh, chunk_size)
-
-            if data_len > self.conn.MAX_PLAIN_DATA_SIZE:
-                if self.data_type != Codec.T_FILE:
-                    raise ProtocolError(f'Attempted to send message larger than {self.conn.MAX_PLAIN_DATA_SIZE}b')
-                decode = buff
-            elif self.data_type != Codec.T_FILE:
-                with buff.open('rb') as _fh:
-                    decode = _fh.read()
-            self.data = await Codec.decode(decode, self.data_type, self.headers)
-            self.data_len = data_len
-        finally:
-            buff.unlink(missing_ok=True)
+        if self.data_type == Codec.T_FILE:
+            buff = tmp_file()
+            try:
+                # Large write buffer batches many small chunks into few write() syscalls
+                with buff.open('wb', buffering=1 << 20) as fh:
+                    self.data_len = await self._recv_chunks(fh)
+                self.data = await Codec.decode(buff, self.data_type, self.headers)
+            finally:
+                buff.unlink(missing_ok=True)
+        else:
+            # Plain payloads are limited by MAX_PLAIN_DATA_SIZE and decoded from memory, no temporary file needed
+            with BytesIO() as fh:
+                self.data_len = await self._recv_chunks(fh, self.conn.MAX_PLAIN_DATA_SIZE)
+                with fh.getbuffer() as view:
+                    self.data = await Codec.decode(view, self.data_type, self.headers)
 
-    async def _recv_large_chunk(self, fh, chunk_size):
-        left = chunk_size
-        part, dst = tmp_file(), tmp_file()
+    async def _recv_chunks(self, fh, limit=None):
+        data_len = 0
+        length = bytearray(_CHUNK_LENGTH.size)
+        self.conn.reset_idle_timer()
+        while True:
+            await self.conn.stream.read_into(length)
+            chunk_size, = _CHUNK_LENGTH.unpack(length)
+            if not chunk_size:
+                break
+            # Remaining limit is passed down, so decompressed output is checked while it is being written
+            left = None if limit is None else limit - data_len
+            if self.compression == Compressor.T_NONE:
+                self._check_limit(chunk_size, left)
+            if chunk_size > 1 << 24:
+                data_len += await self._recv_large_chunk(fh, chunk_size, left)
+            else:
+                data_len += await self._recv_small_chunk(fh, chunk_size, left)
+        return data_len
+
+    async def _recv_large_chunk(self, fh, chunk_size, limit=None):
+        decompressor = Compressor.get_decompressor(self.compression)
+        if decompressor is not None:
+            return await self._recv_to_file(fh, chunk_size, decompressor, limit)
+
+        dst = tmp_file()
         try:
-            with part.open('wb') as tmp:
-                while left > 0:
-                    chunk = await self.conn.stream.read_bytes(left, partial=True)
-                    left -= len(chunk)
-                    tmp.write(chunk)
-            await Compressor.decompress_file(part, dst, compression=self.compression)
-            data_len = os.path.getsize(dst.resolve().as_posix())
-            with dst.open('rb') as tmp:
-                while i := tmp.read(1 << 24):
-                    fh.write(i)
+            data_len = self._check_limit(await self._recv_decompressed(dst, chunk_size), limit)
+            with dst.open('rb') as tmp, buffer_pool.buffer() as buff, memoryview(buff) as view:
+                while n := tmp.readinto(view):
+                    fh.write(view[:n])
             return data_len
         finally:
-            part.unlink(missing_ok=True)
             dst.unlink(missing_ok=True)
 
-    async def _recv_small_chunk(self, fh, chunk_size):
-        left = chunk_size
-        part = bytearray()
-        while left > 0:
-            chunk = await self.conn.stream.read_bytes(left, partial=True)
-            left -= len(chunk)
-            part += chunk
-        part = await Compressor.decompress(part, compression=self.compression)
-        fh.write(part)
-        return len(part)
+    async def _recv_small_chunk(self, fh, chunk_size, limit=None):
+        # Streamed through a pooled buffer and decompressed piece by piece, so output never piles up in memory
+        decompressor = Compressor.get_decompressor(self.compression)
+        if decompressor is not None:
+            return await self._recv_to_file(fh, chunk_size, decompressor, limit)
+
+        if chunk_size > buffer_pool.size:
+            part = bytearray(chunk_size)
+            await self.conn.stream.read_into(part)
+            part = await Compressor.decompress(part, compression=self.compression)
+            self._check_limit(len(part), limit)
+            fh.write(part)
+            return len(part)
+
+        # Chunk is read into a pooled buffer and decompressed straight from its view, nothing is copied in between
+        with buffer_pool.buffer() as buff, memoryview(buff) as view:
+            part = view[:chunk_size]
+            await self.conn.stream.read_into(part)
+            part = await Compressor.decompress(part, compression=self.compression)
+            self._check_limit(len(part), limit)
+            fh.write(part)
+            return len(part)
 
 
 class InputRequest(BasicRequest, type_id=0x02, struct=Struct('>HBBI')):
+    __slots__ = ()
+
     @classmethod
     async def recv_from_conn(cls, conn):
-        buff = await conn.stream.read_bytes(cls.struct.size)
-        message_id, data_type, compression, data_len = cls.struct.unpack(buff)
+        buff = await conn.stream.read_bytes(cls._size)
+        message_id, data_type, compression, data_len = cls._unpack(buff)
 
         headers = await conn.stream.read_until(cls.HEADER_SEPARATOR, data_len)
         data_len -= len(headers)
@@ -314,34 +448,40 @@ class InputRequest(BasicRequest, type_id=0x02, struct=Struct('>HBBI')):
 
 
 class DownloadSpeed(BaseRequest, type_id=0x05, struct=Struct('>I')):
+    __slots__ = ()
+
     @classmethod
     async def recv_from_conn(cls, conn):
         conn.reset_idle_timer()
-        buff = await conn.stream.read_bytes(cls.struct.size)
-        speed, = cls.struct.unpack(buff)
+        buff = await conn.stream.read_bytes(cls._size)
+        speed, = cls._unpack(buff)
         request = cls(conn=conn, message_id=0)
         request.data = speed
         return request
 
 
 class CancelInput(BaseRequest, type_id=0x06, struct=Struct('>H')):
+    __slots__ = ()
+
     @classmethod
     async def recv_from_conn(cls, conn):
         conn.reset_idle_timer()
-        buff = await conn.stream.read_bytes(cls.struct.size)
-        message_id, = cls.struct.unpack(buff)
+        buff = await conn.stream.read_bytes(cls._size)
+        message_id, = cls._unpack(buff)
         return cls(conn=conn, message_id=message_id)
 
 
 class Ping(BaseRequest, type_id=0xFF, struct=Struct('>Q')):
+    __slots__ = ()
+
     @classmethod
     async def recv_from_conn(cls, conn):
         conn.reset_idle_timer()
-        buff = await conn.stream.read_bytes(cls.struct.size)
-        send_time, = cls.struct.unpack(buff)
+        buff = await conn.stream.read_bytes(cls._size)
+        send_time, = cls._unpack(buff)
         request = cls(conn=conn, message_id=0)
         request.data = PingData(
-            send_time=datetime.fromtimestamp(send_time * 1000, tz=pytz.UTC),
-            recv_time=datetime.now(tz=pytz.UTC),
+            send_time=datetime.fromtimestamp(send_time / 1000, tz=timezone.utc),
+            recv_time=datetime.now(tz=timezone.utc),
         )
         return request
@@ -1,8 +1,9 @@
 from abc import ABCMeta
 from asyncio import Future, Task
-from datetime import datetime, timezone
+from datetime import datetime
+from pathlib import Path
 from struct import Struct
-from typing import Any, Dict, Optional, Type, Union
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type, Union
 
 from cats.headers import Headers, T_Headers
 from cats.server.conn import Connection
@@ -33,16 +34,19 @@ class Input:
     def cancel(self): ...
 
 
-class BaseRequest(dict):
+class BaseRequest:
     __slots__ = ('conn', 'message_id', 'headers', 'data',)
     __registry__: Dict[int, Type['BaseRequest']] = {}
+    __type_table__: List[Optional[Type['BaseRequest']]] = [None] * 256
     type_id: int
     struct: Struct
+    _unpack: Callable[[bytes], Tuple[Any, ...]]
+    _unpack_from: Callable[..., Tuple[Any, ...]]
+    _size: int
     HEADER_SEPARATOR = b'\x00\x00'
     status: Union[property, int]
 
     def __init__(self, conn: Connection, message_id: int, *, headers: T_Headers = None, status: int = 200):
-        super().__init__()
         self.conn: Connection = conn
         self.message_id = message_id
         self.headers = Headers(headers or {})
@@ -76,25 +80,43 @@ class BasicRequest(BaseRequest, metaclass=ABCMeta):
 
     async def recv_data(self) -> None: ...
 
+    async def _decompress(self, data: Union[bytes, bytearray, memoryview], limit: Optional[int]) -> Any: ...
+
+    def _inflate(self, decompressor: Any, data: Union[bytes, bytearray, memoryview], limit: Optional[int]) -> bytearray: ...
+
+    async def _recv_into(self, view: memoryview) -> None: ...
+
+    async def _recv_decompressed(self, dst: Path, size: int) -> int: ...
+
+    async def _recv_to_file(self, fh, size: int, decompressor: Any = None, limit: int = None) -> int: ...
+
+    def _check_limit(self, size: int, limit: Optional[int]) -> int: ...
+
 
 class Request(BasicRequest, type_id=0x00, struct=Struct('>HHQBBI')):
-    __slots__ = ('handler_id', 'send_time', 'data_type', 'data_len', 'compression')
+    __slots__ = ('handler_id', '_send_time', '_send_time_ms')
+    send_time: Union[property, datetime]
 
     def __init__(self, conn: Connection, message_id: int, handler_id: int, data_type: int,
-                 send_time: datetime = None, compression: int = 0, data_len: int = 0, *,
+                 send_time: Union[datetime, int] = None, compression: int = 0, data_len: int = 0, *,
                  headers: T_Headers = None, status: int = None):
         self.handler_id = handler_id
-        self.send_time = send_time or datetime.now(timezone.utc)
+        self.send_time = send_time
         super().__init__(conn=conn, message_id=message_id,
                          compression=compression, data_type=data_type, data_len=data_len,
                          headers=headers, status=status)
 
+    @property
+    def send_time_ms(self) -> int: ...
+
     @classmethod
     async def recv_from_conn(cls, conn) -> 'Request': ...
 
 
 class StreamRequest(Request, type_id=0x01, struct=Struct('>HHQBB')):
-    def __init__(self, conn, message_id: int, handler_id: int, data_type: int, send_time: datetime = None, *,
+    __slots__ = ()
+
+    def __init__(self, conn, message_id: int, handler_id: int, data_type: int, send_time: Union[datetime, int] = None, *,
                  headers: T_Headers = None, status: int = None):
         super().__init__(conn, message_id, handler_id, data_type, send_time, headers=headers, status=status)
 
@@ -103,12 +125,16 @@ class StreamRequest(Request, type_id=0x01, struct=Struct('>HHQBB')):
 
     async def recv_data(self) -> None: ...
 
-    async def _recv_large_chunk(self, fh, chunk_size) -> int: ...
+    async def _recv_chunks(self, fh, limit: int = None) -> int: ...
+
+    async def _recv_large_chunk(self, fh, chunk_size, limit: int = None) -> int: ...
 
-    async def _recv_small_chunk(self, fh, chunk_size) -> int: ...
+    async def _recv_small_chunk(self, fh, chunk_size, limit: int = None) -> int: ...
 
 
 class InputRequest(BasicRequest, type_id=0x02, struct=Struct('>HBBI')):
+    __slots__ = ()
+
     @classmethod
     async def recv_from_conn(cls, conn: Connection) -> 'InputRequest': ...
 
@@ -119,16 +145,22 @@ class InputRequest(BasicRequest, type_id=0x02, struct=Struct('>HBBI')):
 
 
 class CancelInput(BaseRequest, type_id=0x06, struct=Struct('>H')):
+    __slots__ = ()
+
     @classmethod
     async def recv_from_conn(cls, conn: Connection): ...
 
 
 class DownloadSpeed(BaseRequest, type_id=0x05, struct=Struct('>I')):
+    __slots__ = ()
+
     @classmethod
     async def recv_from_conn(cls, conn: Connection) -> 'DownloadSpeed': ...
 
 
 class Ping(BaseRequest, type_id=0xFF, struct=Struct('>Q')):
+    __slots__ = ()
+
     data: PingData
 
     @classmethod
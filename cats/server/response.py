@@ -1,25 +1,24 @@
-import os
 from abc import ABCMeta
 from asyncio import sleep
-from datetime import datetime
 from inspect import isasyncgen, isgenerator
-from io import BytesIO
 from pathlib import Path
 from struct import Struct
-
-import pytz
+from time import monotonic, time
+from typing import List
 
 from cats.codecs import Codec
 from cats.compression import Compressor
 from cats.errors import MalformedDataError, ProtocolError
 from cats.headers import Headers, T_Headers
 from cats.typing import BytesAnyGen
-from cats.utils import tmp_file
+from cats.utils import buffer_pool, tmp_file
 
 __all__ = [
     'MAX_SEND_CHUNK_SIZE',
     'BaseResponse',
     'Response',
+    'ResponsePool',
+    'response_pool',
     'StreamResponse',
     'InputResponse',
     'DownloadResponse',
@@ -28,6 +27,11 @@ __all__ = [
 ]
 
 MAX_SEND_CHUNK_SIZE = 1 << 25
+# In-memory payloads up to this size are sent with the message header in a single write
+COALESCE_WRITE_SIZE = 1 << 16
+# Length prefix of headers and data chunks in stream messages
+_CHUNK_LENGTH = Struct('>I')
+_STREAM_END = _CHUNK_LENGTH.pack(0)
 
 
 class BaseResponse:
@@ -59,16 +63,31 @@ class BaseResponse:
     def status(self):
         self.status = 200
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        struct = cls.__dict__.get('struct')
+        if struct is not None:
+            # Bound once, so send_to_conn doesn't resolve self.struct.pack_into per message
+            cls._pack_into = struct.pack_into
+            cls._header_size = 1 + struct.size
+
+    def _build_header(self, *values) -> bytearray:
+        """Packs type byte and struct fields into one buffer, that the rest of the message can be appended to"""
+        header = bytearray(self._header_size)
+        header[0] = self.header_type[0]
+        self._pack_into(header, 1, *values)
+        return header
+
     async def send_to_conn(self, conn):
         raise NotImplementedError
 
     def sleep(self, download_speed: int):
-        start = datetime.now()
+        start = monotonic()
         yield 0
         while True:
             if download_speed:
-                n = max(min(1.0 - (datetime.now() - start).total_seconds(), 1.0), 0)
-                start = datetime.now()
+                n = max(min(1.0 - (monotonic() - start), 1.0), 0)
+                start = monotonic()
                 yield n
             else:
                 yield 0
@@ -93,36 +112,109 @@ class BasicResponse(BaseResponse, metaclass=ABCMeta):
                 raise MalformedDataError('Response payload marked as encoded but type is not specified')
             elif not isinstance(self.data, (bytes, bytearray, memoryview, Path)):
                 raise MalformedDataError('Response payload marked as encoded but data type is not binary')
+
+            # Pre-encoded payload is sent as is, and same response can be sent to many connections
+            if self.compression is None:
+                self.compression = Compressor.T_NONE
+            self._data_len = self.data.stat().st_size if isinstance(self.data, Path) else len(self.data)
             return
 
         self.data, self.data_type = await Codec.encode(self.data, self.headers, self.offset)
 
         if isinstance(self.data, Path):
-            self.data, buff = tmp_file(), self.data
-            self.compression = await Compressor.compress_file(buff, self.data, self.compression)
-            self._data_len = os.path.getsize(self.data.resolve().as_posix())
+            encoded = self.data
+            if self.compression is None:
+                self.compression = await Compressor.propose_compression(encoded)
+
+            # Codec output is a temporary file already, no need to copy it just to leave it uncompressed
+            if self.compression != Compressor.T_NONE:
+                self.data = tmp_file()
+                try:
+                    self.compression = await Compressor.compress_file(encoded, self.data, self.compression)
+                except Exception:
+                    self.data.unlink(missing_ok=True)
+                    raise
+                finally:
+                    encoded.unlink(missing_ok=True)
+            self._data_len = self.data.stat().st_size
         else:
             self.data, self.compression = await Compressor.compress(self.data, self.compression)
             self._data_len = len(self.data)
 
         self.encoded = True
 
-    async def _write_to_stream(self, conn):
-        fh = self.data.open('rb') if isinstance(self.data, Path) else BytesIO(self.data)
+    def _header_fields(self, data_len: int) -> tuple:
+        """Returns values for struct fields, `data_len` covers message headers, separator and payload"""
+        raise NotImplementedError
+
+    async def send_to_conn(self, conn):
+        await self._encode_data(conn)
+
         try:
-            left = self._data_len
-            max_chunk_size = conn.download_speed or MAX_SEND_CHUNK_SIZE
-            sleeper = self.sleep(conn.download_speed)
+            message_headers = self.headers.encode()
+            header = self._build_header(
+                *self._header_fields(self._data_len + len(message_headers) + len(self.HEADER_SEPARATOR))
+            )
+            header += message_headers
+            header += self.HEADER_SEPARATOR
 
-            while left > 0:
-                await sleep(next(sleeper))
-                size = min(left, max_chunk_size)
-                chunk = fh.read(size)
-                left -= size
+            async with conn.lock_write():
                 conn.reset_idle_timer()
-                await conn.stream.write(chunk)
+                if self._can_coalesce(conn):
+                    header += self.data
+                    await conn.stream.write(header)
+                else:
+                    with conn.cork():
+                        await conn.stream.write(header)
+                        await self._write_to_stream(conn)
         finally:
-            fh.close()
+            if isinstance(self.data, Path):
+                self.data.unlink(missing_ok=True)
+
+    def _can_coalesce(self, conn) -> bool:
+        return not conn.download_speed and not isinstance(self.data, Path) and self._data_len <= COALESCE_WRITE_SIZE
+
+    async def _write_to_stream(self, conn):
+        if isinstance(self.data, Path):
+            await self._write_file_to_stream(conn)
+            return
+
+        # Slices of a memoryview share the payload memory, unlike BytesIO.read() which copies every chunk
+        view = memoryview(self.data)
+        pos = 0
+        max_chunk_size = conn.download_speed or MAX_SEND_CHUNK_SIZE
+        sleeper = self.sleep(conn.download_speed)
+
+        write = conn.stream.write
+        while pos < self._data_len:
+            await sleep(next(sleeper))
+            size = min(self._data_len - pos, max_chunk_size)
+            conn.reset_idle_timer()
+            await write(view[pos:pos + size])
+            pos += size
+
+    async def _write_file_to_stream(self, conn):
+        """Sends file through a pooled buffer, so memory use doesn't depend on file or chunk size"""
+        left = self._data_len
+        max_chunk_size = conn.download_speed or MAX_SEND_CHUNK_SIZE
+        sleeper = self.sleep(conn.download_speed)
+
+        write = conn.stream.write
+        with self.data.open('rb') as fh, buffer_pool.buffer() as buff:
+            readinto = fh.readinto
+            view = memoryview(buff)
+            while left > 0:
+                await sleep(next(sleeper))
+                chunk_left = min(left, max_chunk_size)
+                left -= chunk_left
+                while chunk_left > 0:
+                    size = readinto(view[:min(chunk_left, len(view))])
+                    if not size:
+                        raise ValueError('Unexpected end of file')
+                    chunk_left -= size
+                    conn.reset_idle_timer()
+                    # Buffer can be reused only after write() is done, stream keeps a reference till then
+                    await write(view[:size])
 
 
 class Response(BasicResponse):
@@ -142,33 +234,72 @@ class Response(BasicResponse):
 
         self.handler_id: int = 0
 
-    async def send_to_conn(self, conn):
-        await self._encode_data(conn)
+    def _header_fields(self, data_len: int) -> tuple:
+        return self.handler_id, self.message_id, round(time() * 1000), self.data_type, self.compression, data_len
+
+    def reset(self, data=None, compression: int = None, data_type: int = None, *,
+              headers: T_Headers = None, status: int = None) -> None:
+        """
+        Prepares recycled response for a new message. Same checks as __init__, but existing Headers object
+        is refilled instead of allocating a new one
+        """
+        if compression is not None and not isinstance(compression, int):
+            raise MalformedDataError('Invalid compression type')
+        if data_type is not None and not isinstance(data_type, int):
+            raise MalformedDataError('Invalid data type provided')
+        if headers is not None and not isinstance(headers, dict):
+            raise MalformedDataError('Invalid Headers provided')
+
+        self.data = data
+        self.compression = compression
+        self.data_type = data_type
+        self.handler_id = 0
+        self.message_id = 0
+        self._data_len = 0
+        self.offset = 0
+        self.encoded = False
+        self.headers._reset(headers)
+        self.status = self.headers.get('Status', status or 200)
+
+
+class ResponsePool:
+    """
+    Free-list of Response objects for messages sent by Connection.send(), so they aren't allocated per message.
+    Released responses drop their payload, at most `max_size` idle responses are kept
+    """
+    __slots__ = ('max_size', '_free')
 
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._free: List[Response] = []
+
+    def acquire(self, data=None, compression: int = None, data_type: int = None, *,
+                headers: T_Headers = None, status: int = None) -> Response:
         try:
-            message_headers = self.headers.encode() + self.HEADER_SEPARATOR
+            response = self._free.pop()
+        except IndexError:
+            return Response(data, compression, data_type, headers=headers, status=status)
 
-            header = self.header_type + self.struct.pack(
-                self.handler_id,
-                self.message_id,
-                round(datetime.now().timestamp() * 1000),
-                self.data_type,
-                self.compression,
-                self._data_len + len(message_headers)
-            ) + message_headers
+        response.reset(data, compression, data_type, headers=headers, status=status)
+        return response
+
+    def release(self, response: Response) -> None:
+        response.data = None
+        response.headers._reset()
+        if len(self._free) < self.max_size:
+            self._free.append(response)
 
-            async with conn.lock_write():
-                conn.reset_idle_timer()
-                await conn.stream.write(header)
-                await self._write_to_stream(conn)
-        finally:
-            if isinstance(self.data, Path):
-                self.data.unlink(missing_ok=True)
+
+response_pool = ResponsePool(1024)
 
 
 class StreamResponse(Response):
+    __slots__ = ()
+
     struct = Struct('>HHQBB')
     header_type = bytes([0x01])
+    # Used when compression can't be proposed from the first chunk, e.g. stream is empty
+    default_compression = Compressor.T_GZIP
 
     def __init__(self, data: BytesAnyGen, data_type: int, compression: int = None, *,
                  headers: T_Headers = None, status: int = None):
@@ -179,21 +310,22 @@ class StreamResponse(Response):
     async def send_to_conn(self, conn):
         await self._encode_data(conn)
 
-        header = self.header_type + self.struct.pack(
+        message_headers = self.headers.encode()
+        header = self._build_header(
             self.handler_id,
             self.message_id,
-            round(datetime.now().timestamp() * 1000),
+            round(time() * 1000),
             self.data_type,
             self.compression
         )
-        message_headers = self.headers.encode()
+        header += _CHUNK_LENGTH.pack(len(message_headers))
+        header += message_headers
 
         async with conn.lock_write():
             conn.reset_idle_timer()
-            await conn.stream.write(header)
-            await conn.stream.write(len(message_headers).to_bytes(4, 'big', signed=False))
-            await conn.stream.write(message_headers)
-            await self._write_to_stream(conn)
+            with conn.cork():
+                await conn.stream.write(header)
+                await self._write_to_stream(conn)
 
     async def _encode_data(self, conn):
         if self.encoded:
@@ -203,9 +335,6 @@ class StreamResponse(Response):
                 raise MalformedDataError('StreamResponse payload marked as encoded but data type is not AsyncGenerator')
             return
 
-        if self.compression is None:
-            self.compression = await Compressor.propose_compression(b'0' * 5000)
-
         if isgenerator(self.data):
             self.data = self._sync_gen(self.data, conn.download_speed)
         elif isasyncgen(self.data):
@@ -213,8 +342,31 @@ class StreamResponse(Response):
         else:
             raise MalformedDataError('StreamResponse payload is not (Async)Generator[Bytes, None, None]')
 
+        if self.compression is None:
+            await self._propose_compression()
+
         self.encoded = True
 
+    async def _propose_compression(self):
+        """Picks compression by the first chunk, which is put back in front of the stream"""
+        try:
+            first = await self.data.__anext__()
+        except StopAsyncIteration:
+            self.compression = self.default_compression
+            return
+
+        if isinstance(first, (bytes, bytearray, memoryview)):
+            self.compression = await Compressor.propose_compression(first)
+        else:
+            self.compression = self.default_compression
+        self.data = self._prepend(first, self.data)
+
+    @staticmethod
+    async def _prepend(first, gen):
+        yield first
+        async for item in gen:
+            yield item
+
     async def _write_to_stream(self, conn):
         sleeper = self.sleep(conn.download_speed)
         offset = self.offset
@@ -236,59 +388,54 @@ class StreamResponse(Response):
                 raise ProtocolError('Provided data chunk exceeded max chunk size')
 
             conn.reset_idle_timer()
-            await conn.stream.write(chunk_size.to_bytes(4, 'big', signed=False))
-            await conn.stream.write(chunk)
-        await conn.stream.write(b'\x00\x00\x00\x00')
+            if chunk_size <= COALESCE_WRITE_SIZE:
+                await conn.stream.write(_CHUNK_LENGTH.pack(chunk_size) + chunk)
+            else:
+                await conn.stream.write(_CHUNK_LENGTH.pack(chunk_size))
+                await conn.stream.write(chunk)
+        await conn.stream.write(_STREAM_END)
 
     async def _async_gen(self, gen, download_speed: int):
         max_chunk_size = download_speed or MAX_SEND_CHUNK_SIZE
         async for item in gen:
-            left = len(item)
-            while left > 0:
-                s = min(left, max_chunk_size)
-                yield item[:s]
-                item = item[s:]
-                left -= s
+            for chunk in self._split(item, max_chunk_size):
+                yield chunk
 
     async def _sync_gen(self, gen, download_speed: int):
         max_chunk_size = download_speed or MAX_SEND_CHUNK_SIZE
         for item in gen:
-            left = len(item)
-            while left > 0:
-                s = min(left, max_chunk_size)
-                yield item[:s]
-                item = item[s:]
-                left -= s
+            for chunk in self._split(item, max_chunk_size):
+                yield chunk
+
+    @staticmethod
+    def _split(item, max_chunk_size: int):
+        if len(item) <= max_chunk_size or not isinstance(item, (bytes, bytearray, memoryview)):
+            if item:
+                yield item
+            return
+        # Views share memory with the item, slicing it directly would copy the whole tail on every step
+        view = memoryview(item)
+        for pos in range(0, len(view), max_chunk_size):
+            yield view[pos:pos + max_chunk_size]
 
 
 class InputResponse(BasicResponse):
+    __slots__ = ()
+
     struct = Struct('>HBBI')
     header_type = bytes([0x02])
 
-    async def send_to_conn(self, conn):
-        await self._encode_data(conn)
-
-        try:
-            message_headers = self.headers.encode() + self.HEADER_SEPARATOR
-            header = self.header_type + self.struct.pack(
-                self.message_id,
-                self.data_type,
-                self.compression,
-                self._data_len + len(message_headers)
-            ) + message_headers
-
-            async with conn.lock_write():
-                conn.reset_idle_timer()
-                await conn.stream.write(header)
-                await self._write_to_stream(conn)
-        finally:
-            if isinstance(self.data, Path):
-                self.data.unlink(missing_ok=True)
+    def _header_fields(self, data_len: int) -> tuple:
+        return self.message_id, self.data_type, self.compression, data_len
 
 
 class DownloadResponse(BaseResponse):
+    __slots__ = ()
+
     struct = Struct('>I')
     header_type = bytes([0x05])
+    # Message lifting the limit is the same every time, so it is packed once
+    _NO_LIMIT = header_type + struct.pack(0)
 
     def __init__(self, data: int = 0):
         super().__init__(data)
@@ -299,10 +446,12 @@ class DownloadResponse(BaseResponse):
         async with conn.lock_write():
             conn.reset_idle_timer()
             speed: int = self.data
-            await conn.stream.write(self.header_type + speed.to_bytes(4, 'big', signed=False))
+            await conn.stream.write(self._build_header(speed) if speed else self._NO_LIMIT)
 
 
 class CancelInputResponse(BaseResponse):
+    __slots__ = ()
+
     struct = Struct('>H')
     header_type = bytes([0x06])
 
@@ -313,10 +462,12 @@ class CancelInputResponse(BaseResponse):
         async with conn.lock_write():
             conn.reset_idle_timer()
             message_id: int = self.data
-            await conn.stream.write(self.header_type + message_id.to_bytes(2, 'big', signed=False))
+            await conn.stream.write(self._build_header(message_id))
 
 
 class Pong(BaseResponse):
+    __slots__ = ()
+
     struct = Struct('>Q')
     header_type = bytes([0xFF])
 
@@ -326,5 +477,5 @@ class Pong(BaseResponse):
     async def send_to_conn(self, conn):
         async with conn.lock_write():
             conn.reset_idle_timer()
-            now = int(datetime.now(tz=pytz.UTC).timestamp() * 1000)
-            await conn.stream.write(self.header_type + now.to_bytes(8, 'big', signed=False))
+            now = int(time() * 1000)
+            await conn.stream.write(self._build_header(now))
@@ -1,11 +1,11 @@
 import socket
 import ssl
 from asyncio import CancelledError, get_event_loop
-from datetime import datetime
 from logging import getLogger
+from struct import Struct
+from time import time
 from typing import Any, Dict, List, Optional, Tuple, Union
 
-import pytz
 from tornado.iostream import IOStream, StreamClosedError
 from tornado.tcpserver import TCPServer
 from tornado.testing import bind_unused_port
@@ -21,6 +21,9 @@ __all__ = [
 
 logging = getLogger('CATS.Server')
 
+_API_VERSION = Struct('>I')
+_SERVER_TIME = Struct('>Q')
+
 
 class Server(TCPServer):
 
@@ -42,6 +45,10 @@ class Server(TCPServer):
             self.connections.append(conn)
             await conn.start()
         except (KeyboardInterrupt, CancelledError):
+            # Interrupted read_into() leaves its buffer with the stream, closed stream stops filling it
+            if conn is not None:
+                conn.close()
+            stream.close()
             raise
         except Exception as err:
             if isinstance(err, StreamClosedError):
@@ -60,10 +67,9 @@ class Server(TCPServer):
                 self.connections.remove(conn)
 
     async def init_connection(self, stream: IOStream, address: Tuple[str, int]) -> Connection:
-        api_version = int.from_bytes(await stream.read_bytes(4), 'big', signed=False)
+        api_version, = _API_VERSION.unpack(await stream.read_bytes(4))
 
-        current_time = datetime.now(tz=pytz.UTC).timestamp()
-        await stream.write(round(current_time * 1000).to_bytes(8, 'big', signed=False))
+        await stream.write(_SERVER_TIME.pack(round(time() * 1000)))
 
         conn = Connection(stream, address, api_version, self.app)
         if self.handshake is not None:
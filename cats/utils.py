@@ -1,14 +1,19 @@
 import logging
+import os
 import tempfile
+from contextlib import contextmanager
 from importlib import import_module
 
 from pathlib import Path
 
-from typing import Union
+from typing import IO, Iterator, List, Union
 
 __all__ = [
     'require',
     'tmp_file',
+    'copy_file_part',
+    'BufferPool',
+    'buffer_pool',
     'bytes2hex',
     'enable_stream_debug',
 ]
@@ -19,6 +24,73 @@ def tmp_file(**kwargs) -> Path:
     return Path(tempfile.NamedTemporaryFile(**kwargs).name)
 
 
+def copy_file_part(src: IO, dst: IO, offset: int, count: int) -> None:
+    """
+    Copies `count` bytes of `src` starting at `offset` to the current position of `dst`.
+    Uses os.sendfile() where possible, so the data never passes through Python buffers
+
+    :raise ValueError: Source file is shorter than expected
+    """
+    dst.flush()
+    if hasattr(os, 'sendfile'):
+        out_fd, in_fd = dst.fileno(), src.fileno()
+        try:
+            while count > 0:
+                sent = os.sendfile(out_fd, in_fd, offset, count)
+                if not sent:
+                    raise ValueError('Unexpected end of file')
+                offset += sent
+                count -= sent
+            return
+        except OSError:
+            # Platform does not support file-to-file sendfile(), e.g. macOS
+            dst.seek(0, os.SEEK_END)
+
+    src.seek(offset)
+    while count > 0:
+        buff = src.read(min(count, 1 << 20))
+        if not buff:
+            raise ValueError('Unexpected end of file')
+        dst.write(buff)
+        count -= len(buff)
+
+
+class BufferPool:
+    """
+    Free-list of equally sized scratch buffers, so hot I/O loops don't allocate a new one per call.
+    Every concurrent user gets its own buffer, at most `max_size` idle buffers are kept
+    """
+    __slots__ = ('size', 'max_size', '_free')
+
+    def __init__(self, size: int, max_size: int):
+        self.size = size
+        self.max_size = max_size
+        self._free: List[bytearray] = []
+
+    def acquire(self) -> bytearray:
+        try:
+            return self._free.pop()
+        except IndexError:
+            return bytearray(self.size)
+
+    def release(self, buff: bytearray) -> None:
+        if len(self._free) < self.max_size:
+            self._free.append(buff)
+
+    @contextmanager
+    def buffer(self) -> Iterator[bytearray]:
+        """
+        Buffer is returned to the pool only when the block completes. Interrupted IOStream read or write
+        may still reference it, so on any error or cancellation it is dropped and never handed out again
+        """
+        buff = self.acquire()
+        yield buff
+        self.release(buff)
+
+
+buffer_pool = BufferPool(1 << 20, min((os.cpu_count() or 1) * 2, 32))
+
+
 def require(dotted_path: str, /, *, strict: bool = True):
     """
     Import a dotted module path and return the attribute/class designated by the
@@ -37,7 +109,7 @@ def require(dotted_path: str, /, *, strict: bool = True):
         except AttributeError as err:
             raise ImportError(f'Module "{module_path}" does not define a "{class_name}" attribute/class') from err
     except ImportError as err:
-        logging.error(f'Failed to import {dotted_path}')
+        logging.error('Failed to import %s', dotted_path)
         if strict:
             raise err
         return None
@@ -15,9 +15,14 @@ setuptools.setup(
     include_package_data=True,
     install_requires=[
         "tornado >= 6.1",
-        "ujson >= 4.0.2",
+        "orjson >= 3.5.2",
         "sentry-sdk >= 0.20.3",
     ],
+    extras_require={
+        'deflate': ['deflate >= 0.5'],
+        'zstd': ['zstandard >= 0.15'],
+        'lz4': ['lz4 >= 3.1'],
+    },
     use_scm_version=True,
     setup_requires=['setuptools_scm'],
     classifiers=[
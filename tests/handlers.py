@@ -83,3 +83,8 @@ class JsonFormHandler(Handler, api=api, id=0xFFB0):
             'token': os.urandom(32).hex(),
             'code': os.urandom(3).hex(),
         })
+
+
+class JsonInvalidDumpHandler(Handler, api=api, id=0xFFB1):
+    async def handle(self):
+        return await self.json_dump({'a': {1, 2}})
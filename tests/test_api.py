@@ -123,6 +123,15 @@ async def test_api_json_invalid(cats_conn: Connection):
     assert res.status == 500
 
 
+@mark.asyncio
+async def test_api_json_dump_invalid(cats_conn: Connection):
+    await cats_conn.send(0xFFB1, None)
+    res = await asyncio.wait_for(cats_conn.recv(), 1)
+    assert isinstance(res, Request)
+    assert res.status == 500
+    assert res.data['error'] == 'TypeError'
+
+
 @mark.asyncio
 async def test_api_speed_limiter(cats_conn: Connection):
     payload = os.urandom(100_000)
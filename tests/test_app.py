@@ -0,0 +1,26 @@
+from cats.server.app import Application
+from cats.server.handlers import Api
+
+
+def test_resolve_cache_clamps_api_version():
+    api = Api()
+
+    @api.on(1, version=1)
+    async def old(request):
+        pass
+
+    @api.on(1, version=3)
+    async def new(request):
+        pass
+
+    @api.on(2)
+    async def plain(request):
+        pass
+
+    app = Application([api], middleware=[])
+    assert app.resolve(1, 0) is None
+    assert app.resolve(1, 2) is old
+    for api_version in range(3, 1000):
+        assert app.resolve(1, api_version) is new
+        assert app.resolve(2, api_version) is plain
+    assert len(app._dispatch_cache) == 3
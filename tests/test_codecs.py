@@ -1 +1,37 @@
-# FIXME: Cover codecs
+from pytest import mark, raises
+
+from cats.codecs import Codec, FileCodec, FileInfo
+from cats.utils import tmp_file
+
+
+def test_file_normalize_input_paths():
+    a, b = tmp_file(), tmp_file()
+    a.write_bytes(b'123')
+
+    for data in ([a, b], {a.name: a, b.name: b}):
+        result = FileCodec.normalize_input(data)
+        assert set(result) == {a.name, b.name}
+        assert all(isinstance(i, FileInfo) for i in result.values())
+        assert result[a.name].size == 3
+
+
+def test_file_normalize_input_invalid():
+    with raises(TypeError):
+        FileCodec.normalize_input([tmp_file(), 'not a file'])
+    with raises(TypeError):
+        FileCodec.normalize_input({1: tmp_file()})
+
+
+@mark.asyncio
+async def test_file_encode_decode_list():
+    a, b = tmp_file(), tmp_file()
+    a.write_bytes(b'hello')
+    b.write_bytes(b'world!')
+
+    headers = {}
+    encoded, type_id = await Codec.encode([a, b], headers)
+    assert type_id == Codec.T_FILE
+
+    files = await Codec.decode(encoded, type_id, headers)
+    assert files[a.name].path.read_bytes() == b'hello'
+    assert files[b.name].path.read_bytes() == b'world!'
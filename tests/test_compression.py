@@ -1 +1,65 @@
-# FIXME: Cover compression
+import gzip
+
+from pytest import mark, raises, skip
+
+from cats.compression import Compressor
+
+
+def test_gzip_decompressor_chunked():
+    data = b'hello world' * 1000
+    encoded = gzip.compress(data[:5000]) + gzip.compress(data[5000:])
+    decompressor = Compressor.get_decompressor(Compressor.T_GZIP)
+    result = b''.join(b''.join(decompressor.decompress(encoded[i:i + 100])) for i in range(0, len(encoded), 100))
+    assert result + decompressor.flush() == data
+
+
+def test_gzip_decompressor_truncated():
+    decompressor = Compressor.get_decompressor(Compressor.T_GZIP)
+    b''.join(decompressor.decompress(gzip.compress(b'hello world' * 1000)[:-10]))
+    with raises(ValueError):
+        decompressor.flush()
+
+
+def test_gzip_decompressor_bounded_output():
+    data = bytes(40 << 20)
+    decompressor = Compressor.get_decompressor(Compressor.T_GZIP)
+    pieces = list(decompressor.decompress(gzip.compress(data, compresslevel=1)))
+    assert len(pieces) > 1 and max(map(len, pieces)) <= decompressor.MAX_OUTPUT
+    assert b''.join(pieces) + decompressor.flush() == data
+
+
+@mark.parametrize('compression', [Compressor.T_ZSTD, Compressor.T_LZ4])
+@mark.asyncio
+async def test_optional_compressor_round_trip(compression):
+    if compression not in Compressor.compressors:
+        skip('Compression package is not installed')
+    data = b'hello world' * 10000
+    encoded, _ = await Compressor.compress(data, compression)
+    assert await Compressor.decompress(encoded, compression) == data
+
+    decompressor = Compressor.get_decompressor(compression)
+    result = b''.join(b''.join(decompressor.decompress(encoded[i:i + 100])) for i in range(0, len(encoded), 100))
+    assert result + decompressor.flush() == data
+
+
+@mark.parametrize('compression', [Compressor.T_ZSTD, Compressor.T_LZ4])
+def test_optional_decompressor_bounded_output(compression):
+    if compression not in Compressor.compressors:
+        skip('Compression package is not installed')
+    data = bytes(40 << 20)
+    decompressor = Compressor.get_decompressor(compression)
+    encoded = Compressor.compressors[compression]._compress(data) * 2
+    pieces = list(decompressor.decompress(encoded))
+    # zstd output bound is approximate, decompressor may finish a block started by the previous slice
+    assert len(pieces) > 2 and max(map(len, pieces)) <= decompressor.MAX_OUTPUT + (1 << 17)
+    assert b''.join(pieces) + decompressor.flush() == data * 2
+
+
+@mark.parametrize('compression', [Compressor.T_ZSTD, Compressor.T_LZ4])
+def test_optional_decompressor_truncated(compression):
+    if compression not in Compressor.compressors:
+        skip('Compression package is not installed')
+    decompressor = Compressor.get_decompressor(compression)
+    b''.join(decompressor.decompress(Compressor.compressors[compression]._compress(b'hello world' * 1000)[:-10]))
+    with raises(ValueError):
+        decompressor.flush()
@@ -0,0 +1,100 @@
+import socket
+
+from pytest import mark
+from tornado.iostream import IOStream
+
+from cats.server.conn import Connection
+from cats.server.request import Ping
+
+
+@mark.asyncio
+async def test_tick_respects_overridden_handler():
+    class PingCounter(Connection):
+        __slots__ = ('pings',)
+
+        async def handle_ping(self, request):
+            self.pings.append(request)
+
+    conn = PingCounter.__new__(PingCounter)
+    conn.pings = []
+    request = Ping(conn, 0)
+    await conn.tick(request)
+    assert conn.pings == [request]
+
+
+def _tcp_pair():
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen(1)
+    client = socket.create_connection(server.getsockname())
+    accepted, _ = server.accept()
+    server.close()
+    return client, accepted
+
+
+def _conn(sock, download_speed=0):
+    conn = Connection.__new__(Connection)
+    conn.stream = IOStream(sock)
+    conn.download_speed = download_speed
+    return conn
+
+
+def _corked(sock) -> int:
+    return sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_CORK)
+
+
+@mark.skipif(not hasattr(socket, 'TCP_CORK'), reason='TCP_CORK is not supported')
+@mark.asyncio
+async def test_cork_sets_and_clears_tcp_cork():
+    client, accepted = _tcp_pair()
+    conn = _conn(client)
+    try:
+        with conn.cork():
+            assert _corked(client)
+        assert not _corked(client)
+
+        # Throttled connection is left uncorked
+        conn.download_speed = 1024
+        with conn.cork():
+            assert not _corked(client)
+    finally:
+        conn.stream.close()
+        accepted.close()
+
+
+@mark.skipif(not hasattr(socket, 'TCP_CORK'), reason='TCP_CORK is not supported')
+@mark.asyncio
+async def test_cork_skipped_without_tcp_cork(monkeypatch):
+    monkeypatch.setattr('cats.server.conn._TCP_CORK', None)
+    client, accepted = _tcp_pair()
+    conn = _conn(client)
+    try:
+        with conn.cork():
+            assert not _corked(client)
+    finally:
+        conn.stream.close()
+        accepted.close()
+
+
+@mark.asyncio
+async def test_cork_skipped_for_non_inet_socket():
+    left, right = socket.socketpair()
+    conn = _conn(left)
+    try:
+        with conn.cork():
+            pass
+    finally:
+        conn.stream.close()
+        right.close()
+
+
+@mark.skipif(not hasattr(socket, 'TCP_CORK'), reason='TCP_CORK is not supported')
+@mark.asyncio
+async def test_cork_tolerates_stream_closed_inside():
+    client, accepted = _tcp_pair()
+    conn = _conn(client)
+    try:
+        with conn.cork():
+            conn.stream.close()
+    finally:
+        accepted.close()
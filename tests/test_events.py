@@ -1 +1,43 @@
-# FIXME: Cover events
+from pytest import mark
+
+from cats.server import Application
+
+
+@mark.asyncio
+async def test_trigger_calls_sync_and_async_listeners():
+    app = Application([])
+    calls = []
+
+    async def async_listener(value):
+        calls.append(('async', value))
+
+    app.add_event_listener('custom', lambda value: calls.append(('sync', value)))
+    app.add_event_listener('custom', async_listener)
+    await app.trigger('custom', value=1)
+
+    assert sorted(calls) == [('async', 1), ('sync', 1)]
+
+
+@mark.asyncio
+async def test_trigger_without_listeners():
+    app = Application([])
+    await app.trigger('custom')
+
+
+@mark.asyncio
+async def test_remove_event_listener():
+    app = Application([])
+    calls = []
+
+    def listener():
+        calls.append(1)
+
+    listener_id = app.add_event_listener('custom', listener)
+    app.remove_event_listener('custom', listener_id)
+    await app.trigger('custom')
+    assert calls == []
+
+    app.add_event_listener('custom', listener)
+    app.remove_event_listener('custom', listener)
+    await app.trigger('custom')
+    assert calls == []
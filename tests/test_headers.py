@@ -0,0 +1,26 @@
+from cats.headers import Headers
+
+
+def test_encode_cache_invalidated_on_change():
+    headers = Headers(Status=200)
+    encoded = headers.encode()
+    assert headers.encode() is encoded
+
+    headers['Offset'] = 10
+    assert Headers.decode(headers.encode()) == {'Status': 200, 'Offset': 10}
+
+    headers.pop('Offset')
+    headers.update(Status=500)
+    assert Headers.decode(headers.encode()) == {'Status': 500}
+
+    headers |= {'Offset': 5}
+    assert isinstance(headers, Headers)
+    assert Headers.decode(headers.encode()) == {'Status': 500, 'Offset': 5}
+
+
+def test_encode_empty():
+    headers = Headers()
+    assert headers.encode() == b'{}'
+
+    headers['Status'] = 200
+    assert Headers.decode(headers.encode()) == {'Status': 200}
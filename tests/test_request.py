@@ -0,0 +1,56 @@
+import gzip
+from io import BytesIO
+from struct import pack
+from types import SimpleNamespace
+
+from pytest import mark, raises
+
+from cats.codecs import Codec
+from cats.compression import Compressor
+from cats.errors import ProtocolError
+from cats.server.request import Request, StreamRequest
+
+
+class _Stream:
+    def __init__(self, data: bytes):
+        self.buff = BytesIO(data)
+
+    async def read_into(self, buf, partial=False):
+        return self.buff.readinto(buf)
+
+
+def _conn(data: bytes) -> SimpleNamespace:
+    return SimpleNamespace(stream=_Stream(data), reset_idle_timer=lambda: None, MAX_PLAIN_DATA_SIZE=1 << 20)
+
+
+def _stream_request(payload: bytes, compression: int) -> StreamRequest:
+    conn = _conn(pack('>I', len(payload)) + payload + pack('>I', 0))
+    request = StreamRequest(conn, 1, 1, Codec.T_BYTE)
+    request.compression = compression
+    return request
+
+
+@mark.asyncio
+async def test_stream_request_decompressed_limit():
+    request = _stream_request(gzip.compress(bytes(4 << 20), 1), Compressor.T_GZIP)
+    fh = BytesIO()
+    with raises(ProtocolError):
+        await request._recv_chunks(fh, request.conn.MAX_PLAIN_DATA_SIZE)
+    assert fh.tell() <= request.conn.MAX_PLAIN_DATA_SIZE
+
+
+@mark.asyncio
+async def test_stream_request_plain_limit():
+    request = _stream_request(bytes(2 << 20), Compressor.T_NONE)
+    with raises(ProtocolError):
+        await request._recv_chunks(BytesIO(), request.conn.MAX_PLAIN_DATA_SIZE)
+    # Rejected by chunk length, payload is never read
+    assert request.conn.stream.buff.tell() == 4
+
+
+@mark.asyncio
+async def test_request_decompressed_limit():
+    payload = gzip.compress(bytes(4 << 20), 1)
+    request = Request(_conn(payload), 1, 1, Codec.T_BYTE, compression=Compressor.T_GZIP, data_len=len(payload))
+    with raises(ProtocolError):
+        await request.recv_data()
@@ -0,0 +1,71 @@
+import os
+import socket
+from types import SimpleNamespace
+
+from pytest import mark
+from tornado.iostream import IOStream
+
+from cats.codecs import Codec
+from cats.compression import Compressor
+from cats.server.response import Response, ResponsePool, StreamResponse
+from cats.utils import tmp_file
+
+
+def test_response_pool_resets_recycled_response():
+    pool = ResponsePool(1)
+    response = pool.acquire(b'data', headers={'Offset': 5}, status=404)
+    response.handler_id = 1
+    response.message_id = 2
+    pool.release(response)
+    assert response.data is None
+
+    headers = response.headers
+    recycled = pool.acquire(b'other')
+    assert recycled is response and recycled.headers is headers
+    assert recycled.data == b'other'
+    assert recycled.headers == {'Status': 200}
+    assert (recycled.handler_id, recycled.message_id, recycled.offset) == (0, 0, 0)
+
+
+@mark.asyncio
+async def test_pre_encoded_response():
+    response = Response(b'{"a": 1}', data_type=Codec.T_JSON)
+    response.encoded = True
+    await response._encode_data(None)
+    assert (response.data, response.compression, response._data_len) == (b'{"a": 1}', Compressor.T_NONE, 8)
+
+    # Second connection reuses encoded payload
+    await response._encode_data(None)
+    assert response.data == b'{"a": 1}'
+
+
+@mark.asyncio
+async def test_stream_response_proposes_compression_for_buffers():
+    async def gen():
+        yield bytearray(b'small')
+        yield b'tail'
+
+    response = StreamResponse(gen(), data_type=Codec.T_BYTE)
+    await response._propose_compression()
+    assert response.compression == Compressor.T_NONE
+    assert [chunk async for chunk in response.data] == [bytearray(b'small'), b'tail']
+
+
+@mark.asyncio
+async def test_file_response_over_stream():
+    left, right = socket.socketpair()
+    writer, reader = IOStream(left), IOStream(right)
+    payload = os.urandom(3 << 20)
+    response = Response(payload)
+    response.data = tmp_file()
+    try:
+        response.data.write_bytes(payload)
+        response._data_len = len(payload)
+        conn = SimpleNamespace(stream=writer, download_speed=0, reset_idle_timer=lambda: None)
+        received = reader.read_bytes(len(payload))
+        await response._write_file_to_stream(conn)
+        assert await received == payload
+    finally:
+        response.data.unlink(missing_ok=True)
+        writer.close()
+        reader.close()
@@ -0,0 +1,19 @@
+from asyncio import CancelledError
+
+from pytest import raises
+
+from cats.utils import BufferPool
+
+
+def test_buffer_pool_drops_interrupted_buffer():
+    pool = BufferPool(16, 2)
+    with pool.buffer() as buff:
+        pass
+    with pool.buffer() as reused:
+        assert reused is buff
+
+    with raises(CancelledError):
+        with pool.buffer() as interrupted:
+            raise CancelledError
+    with pool.buffer() as other:
+        assert other is not interrupted